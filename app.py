@@ -13,7 +13,18 @@ for path in [BASE_DIR, APP_DIR, VIEWS_DIR, CORE_DIR]:
 
 import streamlit as st
 
-from config import FILE_PATH, MODEL_PATH
+from config import (
+    FILE_PATH,
+    MODEL_PATH,
+    INTERACTIONS_PATH,
+    CAUTIONS_PATH,
+    GROWTH_DIR,
+    OUTBREAK_WINDOW_DAYS,
+    OUTBREAK_ALPHA,
+    OUTBREAK_Z,
+    OUTBREAK_MIN_CASES,
+    OUTBREAK_WARMUP_DAYS,
+)
 from core.utils_ml import build_engine
 from core.utils_auth import authenticate_admin, save_guest_login
 from core.ui_ads import render_vip_sponsors, render_sponsor_footer, render_sponsor_sidebar
@@ -21,6 +32,7 @@ from views.page_home import render_home_page
 from views.page_visit_form import render_visit_form_page
 from views.page_search import render_search_page
 from views.page_analytics import render_analytics_page
+from views.page_query import render_query_page
 from views.page_ai_reco import render_ai_reco_page
 from views.page_admin_accounts import render_admin_accounts_page
 from views.page_sponsors import render_sponsors_page
@@ -36,7 +48,21 @@ LOGIN_IMAGE_PATH = BASE_DIR / "pics" / "photo.jpg"
 
 @st.cache_resource
 def build_engine_cached(file_path: Path, model_path: Path):
-    return build_engine(file_path, model_path, retrain_if_missing=True)
+    return build_engine(
+        file_path,
+        model_path,
+        retrain_if_missing=True,
+        interactions_path=INTERACTIONS_PATH,
+        cautions_path=CAUTIONS_PATH,
+        growth_dir=GROWTH_DIR,
+        outbreak_params={
+            "window": OUTBREAK_WINDOW_DAYS,
+            "alpha": OUTBREAK_ALPHA,
+            "z": OUTBREAK_Z,
+            "min_cases": OUTBREAK_MIN_CASES,
+            "warmup_days": OUTBREAK_WARMUP_DAYS,
+        },
+    )
 
 
 def _set_user(user: dict) -> None:
@@ -155,6 +181,7 @@ def main() -> None:
         ("New Visit", {"en": "New Visit", "ar": "زيارة جديدة"}),
         ("Search Patient", {"en": "Search Patient", "ar": "بحث عن مريض"}),
         ("Clinic Analytics", {"en": "Clinic Analytics", "ar": "تحليلات العيادة"}),
+        ("Clinical Query", {"en": "Clinical Query", "ar": "استعلام سريري"}),
         ("AI Recommendation", {"en": "AI Recommendation", "ar": "توصيات الذكاء الاصطناعي"}),
     ]
     if role == "admin":
@@ -171,17 +198,19 @@ def main() -> None:
     st.markdown(f"### {_t('Welcome', 'مرحبًا')}, {user.get('display_name', 'User')}")
 
     if page == "Home":
-        render_home_page()
+        render_home_page(engine)
     elif page == "New Visit":
         render_visit_form_page(FILE_PATH, engine)
     elif page == "Search Patient":
         render_search_page(engine)
     elif page == "Clinic Analytics":
         render_analytics_page(engine)
+    elif page == "Clinical Query":
+        render_query_page(engine)
     elif page == "AI Recommendation":
         render_ai_reco_page(engine)
     elif page == "Admin Accounts" and role == "admin":
-        render_admin_accounts_page()
+        render_admin_accounts_page(engine)
     elif page == "Sponsors" and role == "admin":
         render_sponsors_page()
 
@@ -1,11 +1,13 @@
 import pandas as pd
 import streamlit as st
 
+from core.ui_tables import render_paginated_table
+from core.utils_analytics import get_analytics
 from core.utils_auth import list_guest_logins
+from core.utils_quality import profile_frame
 
 
-def render_admin_accounts_page() -> None:
-    st.header("Admin Account Management")
+def _render_guest_logins() -> None:
     st.caption("Guest logins captured from the demo access flow.")
 
     rows = list_guest_logins()
@@ -14,7 +16,7 @@ def render_admin_accounts_page() -> None:
         return
 
     df = pd.DataFrame(rows)
-    st.dataframe(df, use_container_width=True)
+    render_paginated_table(df, key="guest_logins", version=len(rows))
 
     csv_data = df.to_csv(index=False).encode("utf-8")
     st.download_button(
@@ -24,3 +26,47 @@ def render_admin_accounts_page() -> None:
         mime="text/csv",
         use_container_width=True,
     )
+
+
+def _render_data_quality(engine) -> None:
+    st.caption("Profiled in chunks straight from the workbook; cached until the data changes.")
+    if engine is None:
+        st.info("Engine is not loaded.")
+        return
+
+    profile = get_analytics(engine, "data_quality")
+    orphans = profile["orphans"]
+    cols = st.columns(len(profile["sheets"]) + 2)
+    for col, (sheet, s) in zip(cols, profile["sheets"].items()):
+        col.metric(sheet, f"{s['rows']:,} rows", f"{s['duplicate_ids']} dup IDs", delta_color="inverse")
+    cols[-2].metric("Visits without patient", orphans["visits_without_patient"])
+    cols[-1].metric("Drug lines without visit", orphans["drug_lines_without_visit"])
+
+    df = profile_frame(profile)
+    render_paginated_table(df, key="data_quality", version=tuple(engine.get("versions", {}).values()))
+    st.download_button(
+        "Download Data Quality Report (CSV)",
+        data=df.to_csv(index=False).encode("utf-8"),
+        file_name="data_quality.csv",
+        mime="text/csv",
+        use_container_width=True,
+    )
+
+    st.subheader("Unmatched drug names")
+    st.caption("Visit_Drugs names not found in Reference_Data (typos are merged automatically; these are only suggestions).")
+    render_paginated_table(
+        get_analytics(engine, "drug_name_suggestions"),
+        key="drug_name_suggestions",
+        version=tuple(engine.get("versions", {}).values()),
+    )
+
+
+def render_admin_accounts_page(engine=None) -> None:
+    st.header("Admin Account Management")
+
+    views = {
+        "Guest Logins": _render_guest_logins,
+        "Data Quality": lambda: _render_data_quality(engine),
+    }
+    choice = st.radio("View", list(views), horizontal=True)
+    views[choice]()
@@ -6,12 +6,11 @@ import streamlit as st
 
 from config import FILE_PATH
 from core.utils_data import (
-    load_data,
-    load_reference_lists,
-    get_next_visit_id,
     save_visit,
     save_visit_drugs,
 )
+from core.utils_analytics import regimen_template
+from core.utils_ml import engine_add_visit, engine_snapshot, engine_next_visit_id
 
 
 def render_ai_reco_page(engine):
@@ -20,8 +19,8 @@ def render_ai_reco_page(engine):
     """
     st.header("🤖 توصية علاج بالذكاء الاصطناعي (Data-driven)")
 
-    # نقرأ أحدث نسخة من البيانات من الإكسل
-    patients, visits, visit_drugs, ref, merged = load_data(FILE_PATH)
+    # أحدث نسخة من الـ Engine (بتتحدث مع كل حفظ) – مفيش قراءة للإكسل هنا
+    patients, visits, visit_drugs, ref, merged = engine_snapshot(engine)
 
     if patients.empty:
         st.warning("لا توجد بيانات مرضى في الملف حتى الآن.")
@@ -93,35 +92,15 @@ def render_ai_reco_page(engine):
         st.warning("التشخيص غير موجود في آخر زيارة، لا يمكن توليد توصية علاج.")
         return
 
-    # نستخدم الـ merged (Visits + Visit_Drugs) لاستخراج الأدوية الأكثر تكراراً لنفس التشخيص
-    df = merged.copy()
-    df["Diagnosis"] = df["Diagnosis"].astype(str).str.strip()
-
-    similar = df.loc[df["Diagnosis"] == diagnosis].copy()
-
-    if similar.empty:
+    # قالب العلاج لكل تشخيص محسوب على الـ Engine (بيتحدث مع كل حفظ)
+    # → lookup بالتشخيص + أعلى top_k دواء بدل groupby على كل الداتا
+    templates = engine["regimen_templates"]
+    if not templates.get(diagnosis):
         st.info("لا توجد زيارات أخرى بنفس هذا التشخيص في البيانات، لا يمكن بناء توصية من السجل التاريخي.")
         return
 
-    # نحسب أكثر الأدوية استخداماً مع هذا التشخيص
-    grp = (
-        similar.groupby("Drug_Name")
-        .agg(
-            n=("Drug_Name", "size"),
-            avg_dose=("Dose_Value", "mean"),
-            most_dose_unit=("Dose_Unit", lambda x: x.value_counts().index[0]),
-            most_freq_unit=("Freq_Unit", lambda x: x.value_counts().index[0]),
-            avg_freq=("Freq_Value", "mean"),
-            avg_duration=("Duration_Days", "mean"),
-            most_route=("Route", lambda x: x.value_counts().index[0]),
-        )
-        .reset_index()
-    )
-
-    grp = grp.sort_values("n", ascending=False)
-
     top_k = st.slider("عدد الأدوية المقترحة", min_value=1, max_value=5, value=3, step=1)
-    top_drugs = grp.head(top_k).copy()
+    top_drugs = regimen_template(templates, diagnosis, top_k)
 
     if top_drugs.empty:
         st.info("لا توجد أدوية كافية مرتبطة بهذا التشخيص في البيانات.")
@@ -181,7 +160,7 @@ def render_ai_reco_page(engine):
         )
 
     if st.button("💾 حفظ كزيارة جديدة + روشتة مقترحة"):
-        new_visit_id = get_next_visit_id(FILE_PATH)
+        new_visit_id = engine_next_visit_id(engine)
 
         # نحضر صف الزيارة الجديدة بالاعتماد على آخر زيارة
         visit_row = {
@@ -227,6 +206,7 @@ def render_ai_reco_page(engine):
             line_no += 1
 
         save_visit_drugs(FILE_PATH, drug_rows)
+        engine_add_visit(engine, visit_row, drug_rows)
 
         st.success(
             f"تم حفظ زيارة جديدة برقم {new_visit_id} للمريض {patient_id} مع الروشتة المقترحة ✅"
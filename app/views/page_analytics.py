@@ -1,34 +1,127 @@
 # app/pages/page_analytics.py
 import streamlit as st
 
-from core.utils_analytics import (
-    analysis_a1,
-    analysis_a2,
-    analysis_a3,
-)
+from config import DOSE_Z_THRESHOLD
+from core.ui_tables import render_paginated_table
+from core.utils_analytics import get_analytics, cohort_slice, OUTLIER_MEMO_Z
+from core.utils_data import AGE_BAND_LABELS, WEIGHT_BAND_LABELS
+from core.utils_trends import cube_frame, outbreak_alerts
 
 
-def render_analytics_page(engine):
-    st.header("📊 تحليلات العيادة")
+def _versions(engine):
+    return tuple(engine.get("versions", {}).values())
+
+
+def _render_table(engine, table_name, title):
+    st.subheader(title)
+    render_paginated_table(get_analytics(engine, table_name), key=f"tbl_{table_name}", version=_versions(engine))
+
+
+def _render_dose_outliers(engine):
+    st.subheader("A-7 Dose outliers (dose per KG vs. same drug + unit)")
+    z = st.slider(
+        "حد الـ z-score",
+        min_value=float(OUTLIER_MEMO_Z),
+        max_value=8.0,
+        value=float(max(DOSE_Z_THRESHOLD, OUTLIER_MEMO_Z)),
+        step=0.5,
+    )
+    out = get_analytics(engine, "dose_outliers")
+    out = out[out["dose_z"].abs() > z]
+    st.caption(f"عدد السطور الشاذة: {len(out)}")
+    render_paginated_table(out, key="tbl_dose_outliers", version=(_versions(engine), z))
+
+
+def _render_recurrence(engine):
+    st.subheader("A-4/A-5 Recurrence by Diagnosis (fastest recurring first)")
+    render_paginated_table(
+        get_analytics(engine, "recurrence_by_diagnosis"), key="tbl_recurrence", version=_versions(engine)
+    )
 
-    data_merged = engine["data_merged"]
 
-    tab1, tab2, tab3 = st.tabs(
-        [
-            "A-1 أفضل دواء لكل تشخيص",
-            "A-2 نسبة الشفاء حسب الأعراض",
-            "A-3 فعالية الدواء الشاملة",
-        ]
+def _render_trends(engine):
+    st.subheader("📈 Trends over time (from the pre-aggregated cube)")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        freq_label = st.selectbox("الفترة", ["شهري", "أسبوعي", "يومي"])
+    with c2:
+        metric_label = st.selectbox("المقياس", ["عدد الزيارات", "عدد سطور الأدوية"])
+    with c3:
+        by = st.selectbox("التقسيم حسب", ["Diagnosis", "Drug_Name", "Outcome_Class"])
+
+    freq = {"شهري": "M", "أسبوعي": "W", "يومي": "D"}[freq_label]
+    metric = "visits" if metric_label == "عدد الزيارات" else "lines"
+    tbl = cube_frame(engine["trend_cube"], metric=metric, freq=freq, by=by)
+    if tbl.empty:
+        st.info("لا توجد بيانات زمنية بعد.")
+        return
+
+    top = tbl.groupby(by)["count"].sum().nlargest(8).index.tolist()
+    chosen = st.multiselect("القيم المعروضة", sorted(tbl[by].unique()), default=top)
+    tbl = tbl[tbl[by].isin(chosen)]
+
+    chart = tbl.pivot_table(index="period", columns=by, values="count", aggfunc="sum", fill_value=0)
+    st.line_chart(chart)
+    st.dataframe(tbl)
+
+
+def _render_cohorts(engine):
+    st.subheader("👶 Cohort analytics (age band × weight band)")
+    c1, c2, c3 = st.columns([1, 1, 1.2])
+    with c1:
+        age_bands = st.multiselect("شريحة العمر", AGE_BAND_LABELS + ["Unknown"])
+    with c2:
+        weight_bands = st.multiselect("شريحة الوزن", WEIGHT_BAND_LABELS + ["Unknown"])
+    with c3:
+        level = st.radio(
+            "الجدول",
+            ["a1", "a2", "a3"],
+            format_func={
+                "a1": "A-1 دواء × تشخيص",
+                "a2": "A-2 تشخيص × شكوى",
+                "a3": "A-3 فعالية الدواء",
+            }.get,
+            horizontal=True,
+        )
+
+    partials = get_analytics(engine, "cohort_partials")
+    render_paginated_table(
+        cohort_slice(partials, level, age_bands, weight_bands),
+        key="tbl_cohorts",
+        version=(_versions(engine), level, tuple(age_bands), tuple(weight_bands)),
     )
 
-    with tab1:
-        st.subheader("A-1 Drug effectiveness per Diagnosis")
-        st.dataframe(analysis_a1(data_merged))
 
-    with tab2:
-        st.subheader("A-2 Cure rate by Diagnosis + Chief Complaint")
-        st.dataframe(analysis_a2(data_merged))
+def render_analytics_page(engine):
+    st.header("📊 تحليلات العيادة")
 
-    with tab3:
-        st.subheader("A-3 Drug speed + reliability + effectiveness score")
-        st.dataframe(analysis_a3(data_merged))
+    alerts = outbreak_alerts(engine["outbreak"])
+    if not alerts.empty:
+        with st.expander(f"🚨 تنبيه: زيادة غير معتادة في {len(alerts)} تشخيص", expanded=True):
+            st.dataframe(alerts, use_container_width=True)
+
+    # بدل st.tabs (اللي بتنفّذ كل التابات) – بنحسب التاب المفتوح بس
+    # والنتيجة محفوظة على الـ Engine لحد ما الداتا تتغير
+    views = {
+        "A-1 أفضل دواء لكل تشخيص": lambda: _render_table(
+            engine, "a1", "A-1 Drug effectiveness per Diagnosis"
+        ),
+        "A-2 نسبة الشفاء حسب الأعراض": lambda: _render_table(
+            engine, "a2", "A-2 Cure rate by Diagnosis + Chief Complaint"
+        ),
+        "A-3 فعالية الدواء الشاملة": lambda: _render_table(
+            engine, "a3", "A-3 Drug speed + reliability + effectiveness score"
+        ),
+        "A-4/A-5 تكرار المرض": lambda: _render_recurrence(engine),
+        "A-7 جرعات شاذة": lambda: _render_dose_outliers(engine),
+        "📈 الاتجاهات الزمنية": lambda: _render_trends(engine),
+        "👶 تحليل حسب العمر والوزن": lambda: _render_cohorts(engine),
+    }
+    selected = st.radio(
+        "التحليل",
+        list(views.keys()),
+        horizontal=True,
+        label_visibility="collapsed",
+        key="analytics_tab",
+    )
+    views[selected]()
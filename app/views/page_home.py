@@ -2,8 +2,10 @@
 from pathlib import Path
 import streamlit as st
 
+from core.utils_trends import outbreak_alerts
 
-def render_home_page():
+
+def render_home_page(engine=None):
     # ====== شوية CSS بسيط يخلي الصفحة شيك على شاشة العيادة ======
     st.markdown(
         """
@@ -104,6 +106,16 @@ def render_home_page():
 
     st.markdown("---")
 
+    # ====== تنبيهات الزيادة المفاجئة في التشخيصات ======
+    if engine is not None and engine.get("outbreak"):
+        alerts = outbreak_alerts(engine["outbreak"])
+        for _, a in alerts.iterrows():
+            st.warning(
+                f"🚨 زيادة غير معتادة في **{a['Diagnosis']}**: "
+                f"{a['window_cases']} حالة في آخر {engine['outbreak']['window']} أيام "
+                f"(المعتاد ≈ {a['baseline']})"
+            )
+
     # ====== صف واحد: صورة الدكتور + بياناته ======
     col_img, col_info = st.columns([1, 1.1])
 
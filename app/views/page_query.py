@@ -0,0 +1,75 @@
+# app/views/page_query.py
+import math
+
+import streamlit as st
+
+from core.utils_analytics import get_analytics
+from core.utils_data import AGE_BAND_LABELS
+from core.utils_query import query_visits, query_summary, query_page
+
+
+PAGE_SIZE = 50
+
+
+def render_query_page(engine):
+    st.header("🧪 Clinical Query (استعلام على الزيارات)")
+    st.caption("كل الفلاتر بتتجمع مع بعض (AND). الفلتر الفاضي = كل القيم.")
+
+    # الفهرس بيتبني مرة لكل نسخة داتا (memo على الـ Engine)
+    index = get_analytics(engine, "query_index")
+    cats = index["categories"]
+    if not index["n"]:
+        st.info("لا توجد زيارات بعد.")
+        return
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        diagnoses = st.multiselect("التشخيص (Diagnosis)", cats["Diagnosis"])
+    with c2:
+        drugs = st.multiselect("الدواء (Drug)", cats["Drug_Name"])
+    with c3:
+        outcomes = st.multiselect("النتيجة (Outcome)", cats["Outcome_Class"])
+
+    c4, c5, c6 = st.columns(3)
+    with c4:
+        use_dates = st.checkbox("فلتر بالتاريخ")
+        date_from = date_to = None
+        if use_dates and len(index["dates"]):
+            first, last = index["dates"][0], index["dates"][-1]
+            picked = st.date_input("من / إلى", value=(first.astype("M8[D]").item(), last.astype("M8[D]").item()))
+            if isinstance(picked, (list, tuple)) and len(picked) == 2:
+                date_from, date_to = picked
+    with c5:
+        use_age = st.checkbox("فلتر بالعمر (سنين)")
+        age_min = age_max = None
+        if use_age:
+            lo, hi = st.slider("العمر", min_value=0.0, max_value=18.0, value=(1.0, 3.0), step=0.5)
+            age_min, age_max = lo * 12, hi * 12
+    with c6:
+        age_bands = st.multiselect("شريحة العمر", AGE_BAND_LABELS)
+
+    positions = query_visits(
+        index,
+        diagnoses=diagnoses,
+        drugs=drugs,
+        outcomes=outcomes,
+        date_from=date_from,
+        date_to=date_to,
+        age_min_months=age_min,
+        age_max_months=age_max,
+        age_bands=age_bands,
+    )
+
+    summary = query_summary(index, positions)
+    m1, m2, m3 = st.columns(3)
+    m1.metric("سطور أدوية", summary["rows"])
+    m2.metric("زيارات", summary["visits"])
+    m3.metric("مرضى", summary["patients"])
+
+    if not summary["rows"]:
+        st.info("لا توجد نتائج بالفلاتر دي.")
+        return
+
+    n_pages = max(math.ceil(summary["rows"] / PAGE_SIZE), 1)
+    page = st.number_input(f"الصفحة (من {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+    st.dataframe(query_page(index, positions, page=int(page), page_size=PAGE_SIZE), use_container_width=True)
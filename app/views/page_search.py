@@ -2,13 +2,22 @@
 import streamlit as st
 import pandas as pd
 
+from core.ui_tables import render_paginated_table
+from core.utils_analytics import get_analytics, engine_frame
+from core.utils_data import build_patient_timeline, patient_timeline
+from core.utils_search import (
+    build_patient_index,
+    search_patients,
+    fuzzy_search_patients,
+    take_patients,
+)
+
 
 def render_search_page(engine):
     st.header("🔍 بحث عن مريض")
 
-    patients = engine["patients"]
-    visits = engine["visits"]
-    visit_drugs = engine["visit_drugs"]
+    patients = engine_frame(engine, "patients")
+    visits = engine_frame(engine, "visits")
 
     col1, col2 = st.columns(2)
 
@@ -19,25 +28,37 @@ def render_search_page(engine):
         btn_pid = st.button("بحث بالرقم")
 
     with col2:
-        name_search = st.text_input("بحث بالاسم (أول جزء من الاسم)")
+        name_search = st.text_input("بحث بالاسم أو الهاتف")
+        fuzzy = st.checkbox("بحث تقريبي (أخطاء إملائية / عربي ↔ English)")
         btn_name = st.button("بحث بالاسم")
 
-    result_patients = pd.DataFrame()
-
+    # آخر بحث بيتحفظ في الـ session: أدوات الجدول (فلتر/ترتيب/صفحة) بتعمل rerun
+    # والزرار بيرجع False – النتيجة بتتبني تاني من الـ state في كل rerun
     if btn_pid and pid_search > 0:
-        result_patients = patients[patients["Patient_ID"] == pid_search]
+        st.session_state["search_hits"] = {"pid": pid_search}
 
     if btn_name and name_search.strip():
-        result_patients = patients[
-            patients["Patient_Name"].str.contains(name_search, case=False, na=False)
-        ]
+        index = engine.get("patient_index") or build_patient_index(patients)
+        if fuzzy:
+            hits = fuzzy_search_patients(index, name_search, limit=20)
+        else:
+            hits = search_patients(index, name_search, limit=50)
+        st.session_state["search_hits"] = {"query": name_search.strip(), "fuzzy": fuzzy, "hits": hits}
+
+    search = st.session_state.get("search_hits")
+    result_patients = pd.DataFrame()
+    if search is not None and "pid" in search:
+        result_patients = patients[patients["Patient_ID"] == search["pid"]]
+    elif search is not None:
+        result_patients = take_patients(patients, search["hits"])
 
     if result_patients.empty:
         st.info("لم يتم العثور على نتائج بعد.")
         return
 
     st.subheader("📋 نتائج البحث عن المريض")
-    st.dataframe(result_patients)
+    versions = tuple(engine.get("versions", {}).values())
+    render_paginated_table(result_patients, key="search_results", version=(versions, search.get("pid"), search.get("query"), search.get("fuzzy")))
 
     # لو عندنا مريض واحد فقط، نعرض ملفه بالتفصيل
     if len(result_patients) == 1:
@@ -59,16 +80,21 @@ def render_search_page(engine):
 """
         )
 
+        # timeline محسوب مرة على الـ Engine (زيارات + أدوية مرتبة) – lookup بالرقم
+        timeline = engine.get("timeline") or build_patient_timeline(engine_frame(engine, "data_merged"))
+        tl = patient_timeline(timeline, sel_id)
+
         st.markdown("### 🩺 زيارات المريض")
-        v = visits[visits["Patient_ID"] == sel_id].sort_values("Visit_Date")
-        st.dataframe(v)
+        visit_cols = [c for c in visits.columns if c in tl.columns]
+        v = tl.drop_duplicates("Visit_ID")[visit_cols].reset_index(drop=True)
+        if engine.get("growth_tables"):
+            # z-scores محسوبة مرة لكل الزيارات ومحفوظة على الـ Engine
+            v = v.merge(get_analytics(engine, "growth"), left_on="Visit_ID", right_index=True, how="left")
+        else:
+            st.caption("جداول النمو WHO غير موجودة (assets/growth) – لن تظهر z-scores.")
+        render_paginated_table(v, key="patient_visits", version=(versions, sel_id))
 
         st.markdown("### 💊 كل الأدوية التي وصفت للمريض")
-        merged = (
-            visit_drugs.merge(visits, on="Visit_ID", how="left")
-            .merge(patients, on="Patient_ID", how="left")
-        )
-        d = merged[merged["Patient_ID"] == sel_id].sort_values(
-            ["Visit_Date", "Line_No"]
-        )
-        st.dataframe(d)
+        # الزيارات اللي مفيهاش أدوية بتطلع من الـ left join بـ Drug_Name فاضي
+        d = tl.dropna(subset=["Drug_Name"]) if "Drug_Name" in tl.columns else tl
+        render_paginated_table(d, key="patient_drugs", version=(versions, sel_id))
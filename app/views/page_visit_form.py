@@ -3,18 +3,38 @@
 from pathlib import Path
 import base64
 
+import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
 
 from core.utils_data import (
     load_data,
-    load_reference_lists,
+    build_reference_lists,
     get_next_patient_id,
     get_next_visit_id,
     save_patient,
     save_visit,
     save_visit_drugs,
 )
+from core.utils_drugs import regimen_interactions, regimen_cautions
+from core.utils_search import (
+    build_patient_index,
+    search_patients,
+    fuzzy_search_patients,
+    possible_duplicates,
+    recent_patient_ids,
+    patient_label,
+    take_patients,
+)
+from core.utils_ml import (
+    engine_add_patient,
+    engine_add_visit,
+    engine_next_patient_id,
+    engine_next_visit_id,
+)
+from core.utils_growth import growth_for_measurement
+from core.utils_analytics import get_analytics, engine_frame, suggest_dose, score_dose
+from config import DOSE_Z_THRESHOLD, DOSE_MIN_CASES
 from core.prescription import (
     load_profile,
     save_profile,
@@ -23,6 +43,52 @@ from core.prescription import (
 )
 
 
+# عدد المرضى اللي بيظهروا في اختيار المريض (نتايج البحث أو آخر المضافين)
+PATIENT_OPTIONS = 30
+
+# أقسام الصفحة بتتعمل rerun لوحدها (st.fragment، أو experimental_fragment في
+# النسخ الأقدم من Streamlit – ولو الاتنين مش موجودين الصفحة بتشتغل زي الأول)
+_st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+_fragment = _st_fragment or (lambda f: f)
+
+
+def _rerun_app():
+    """
+    rerun للصفحة كلها من جوه fragment – لما قيمة بيقراها fragment تاني تتغير
+    (من غير fragments الصفحة كلها بتتعمل rerun أصلاً).
+    """
+    if _st_fragment is None:
+        return
+    try:
+        st.rerun(scope="app")
+    except TypeError:
+        # النسخ القديمة: st.rerun من جوه experimental_fragment = الصفحة كلها
+        st.rerun()
+
+
+def _request_app_rerun():
+    # st.rerun جوه callback مالوش أثر – الـ fragment بيعمله أول ما يبدأ
+    st.session_state["_visit_rerun_app"] = True
+
+
+def _rx_rows_from_state(n_rows):
+    """سطور الروشتة من Session State (نفس الـ keys بتاعة ويدجتس الأدوية)."""
+    ss = st.session_state
+    return [
+        dict(
+            Drug_Name=ss.get(f"drug_name_{i}", ""),
+            Dose_Value=ss.get(f"dose_val_{i}", 0.0),
+            Dose_Unit=ss.get(f"dose_unit_{i}"),
+            Freq_Value=ss.get(f"freq_val_{i}", 0.0),
+            Freq_Unit=ss.get(f"freq_unit_{i}"),
+            Duration_Days=ss.get(f"duration_{i}", 0),
+            Route=ss.get(f"route_{i}"),
+            Instructions=ss.get(f"instructions_{i}", ""),
+        )
+        for i in range(n_rows)
+    ]
+
+
 def render_visit_form_page(file_path, engine=None):
     lang = st.session_state.get("ui_lang", "en")
 
@@ -36,7 +102,12 @@ def render_visit_form_page(file_path, engine=None):
     # تحميل البيانات والـ Reference Lists
     # ============================================
     try:
-        patients, visits, visit_drugs, ref, merged = load_data(file_path)
+        # من الـ Engine (نفس الداتا لكل الصفحات) – الإكسل بس لو مفيش Engine
+        if engine is not None:
+            # الفورم محتاج المرضى + Reference_Data بس (الزيارات بتتدمج لما صفحة تانية تطلبها)
+            patients, ref = engine_frame(engine, "patients"), engine["ref"]
+        else:
+            patients, visits, visit_drugs, ref, merged = load_data(file_path)
     except Exception as e:
         st.error(_t(f"Failed to load data from Excel file: {e}", f"خطأ في تحميل البيانات من ملف الإكسل: {e}"))
         return
@@ -44,39 +115,80 @@ def render_visit_form_page(file_path, engine=None):
     if patients.empty:
         st.warning(_t("No patients found in the database. Please add a patient first.", "لا يوجد مرضى في قاعدة البيانات. من فضلك أضف مريض أولًا."))
 
+    patient_index = engine["patient_index"] if engine is not None else build_patient_index(patients)
+
     # ============================================
-    # Search Patient (Quick Lookup)
+    # Search + Select Patient (fragment – الكتابة في البحث بتعيد القسم ده بس)
     # ============================================
-    st.subheader(_t("🔍 Search Patient", "🔍 بحث عن مريض"))
-    search_query = st.text_input(
-        _t("Search by ID / Name / Phone", "ابحث بالرقم / الاسم / الهاتف"),
-        key="patient_search_query",
-    )
-    filtered_patients = patients
-    if search_query.strip():
-        q = search_query.strip()
-        mask = None
-        if "Patient_ID" in patients.columns:
-            m = patients["Patient_ID"].astype(str).str.contains(q, na=False)
-            mask = m if mask is None else (mask | m)
-        if "Patient_Name" in patients.columns:
-            m = patients["Patient_Name"].astype(str).str.contains(q, case=False, na=False)
-            mask = m if mask is None else (mask | m)
-        if "Phone_Number" in patients.columns:
-            m = patients["Phone_Number"].astype(str).str.contains(q, case=False, na=False)
-            mask = m if mask is None else (mask | m)
-        if mask is not None:
-            filtered_patients = patients[mask]
-    if not filtered_patients.empty:
-        cols = [c for c in ["Patient_ID", "Patient_Name", "Phone_Number"] if c in filtered_patients.columns]
-        st.dataframe(filtered_patients[cols], use_container_width=True)
+    @_fragment
+    def _patient_picker():
+        st.subheader(_t("🔍 Search Patient", "🔍 بحث عن مريض"))
+        search_query = st.text_input(
+            _t("Search by ID / Name / Phone", "ابحث بالرقم / الاسم / الهاتف"),
+            key="patient_search_query",
+        )
+        hits = []
+        if search_query.strip():
+            hits = search_patients(patient_index, search_query, limit=PATIENT_OPTIONS)
+            if not hits:
+                # مفيش تطابق مباشر – جرّب البحث التقريبي
+                hits = fuzzy_search_patients(patient_index, search_query, limit=10)
+                if hits:
+                    st.caption(_t("No exact match – showing similar names.", "لا يوجد تطابق – عرض أسماء مشابهة."))
+            found = take_patients(patients, hits)
+            if not found.empty:
+                cols = [c for c in ["Patient_ID", "Patient_Name", "Phone_Number", "Score"] if c in found.columns]
+                st.dataframe(found[cols], use_container_width=True)
+
+        # اختيار المريض: أفضل N من الفهرس بس – مش كل المرضى
+        # selected_patient_id = اختيار صريح بس (تغيير الـ selectbox / إضافة سريعة)
+        pinned_id = st.session_state.get("selected_patient_id")
+        if hits:
+            # نتيجة بحث → الافتراضي أعلى نتيجة، والمفتاح بيتغير مع البحث (widget جديد)
+            patient_ids = [pid for pid, _ in hits]
+            default_index = 0
+            pick_key = f"patient_pick_q_{search_query.strip()}"
+        else:
+            patient_ids = recent_patient_ids(patient_index, PATIENT_OPTIONS)
+            if pinned_id in patient_index["pos_of"] and pinned_id not in patient_ids:
+                patient_ids = [pinned_id] + patient_ids
+            default_index = patient_ids.index(pinned_id) if pinned_id in patient_ids else 0
+            pick_key = f"patient_pick_recent_{pinned_id}"
+        if not patient_ids:
+            st.session_state.pop("visit_patient_id", None)
+            return
+
+        def _pin_patient():
+            st.session_state["selected_patient_id"] = int(st.session_state[pick_key])
+
+        st.subheader(_t("🧒 Select Patient", "🧒 اختيار المريض"))
+        st.caption(_t(
+            "Showing the best matches for the search above (or the latest patients).",
+            "بيظهر أقرب نتائج للبحث اللي فوق (أو آخر المرضى المضافين).",
+        ))
+        patient_id = st.selectbox(
+            _t("Patient ID", "رقم المريض"),
+            options=patient_ids,
+            index=default_index,
+            format_func=lambda pid: patient_label(patient_index, pid),
+            key=pick_key,
+            on_change=_pin_patient,
+        )
+        # المريض الظاهر في الـ selectbox دلوقتي = اللي الزيارة هتتسجل له
+        prev_id = st.session_state.get("visit_patient_id")
+        st.session_state["visit_patient_id"] = int(patient_id)
+        # مريض تاني → الصفحة كلها (بيانات الزيارة بتقرا نوعه لـ z-scores النمو)
+        if prev_id is not None and prev_id != int(patient_id):
+            _rerun_app()
+
+    _patient_picker()
 
     st.markdown("---")
     # ============================================
     # New Patient (Inline)
     # ============================================
     st.subheader(_t("➕ New Patient (Quick Add)", "➕ مريض جديد (إضافة سريعة)"))
-    new_patient_id = get_next_patient_id(file_path)
+    new_patient_id = engine_next_patient_id(engine) if engine is not None else get_next_patient_id(file_path)
     st.info(_t(f"New Patient ID: **{new_patient_id}**", f"رقم المريض الجديد: **{new_patient_id}**"))
 
     with st.form("patient_form_inline"):
@@ -92,10 +204,27 @@ def render_visit_form_page(file_path, engine=None):
 
         allergies = st.text_input(_t("Allergies (optional)", "الحساسية (اختياري)"))
         notes = st.text_area(_t("Notes (optional)", "ملاحظات (اختياري)"))
+        save_anyway = st.checkbox(
+            _t("Save even if a similar patient exists", "احفظ حتى لو فيه مريض مشابه"),
+        )
 
         submitted_new = st.form_submit_button(_t("Save Patient", "حفظ المريض"))
 
-    if submitted_new:
+    duplicates = []
+    if submitted_new and name.strip() and not save_anyway:
+        duplicates = possible_duplicates(patient_index, name, phone, dob=dob, parent_name=parent_name)
+    if duplicates:
+        st.warning(
+            _t(
+                "Possible duplicate patient – check the list below, or tick 'Save even if a similar patient exists'.",
+                "ممكن يكون المريض مسجل قبل كده – راجع القائمة، أو علّم على 'احفظ حتى لو فيه مريض مشابه'.",
+            )
+        )
+        dup_cols = ["Patient_ID", "Score", "Patient_Name", "Phone_Number", "DOB", "Parent_Name"]
+        dup_df = take_patients(patients, duplicates)
+        st.dataframe(dup_df.reindex(columns=dup_cols), use_container_width=True)
+
+    if submitted_new and not duplicates:
         if not name.strip():
             st.error(_t("Please enter patient name.", "من فضلك أدخل اسم المريض."))
         else:
@@ -113,12 +242,15 @@ def render_visit_form_page(file_path, engine=None):
             try:
                 save_patient(file_path, row)
                 st.session_state["selected_patient_id"] = int(new_patient_id)
-                st.success(_t(f"Patient saved: {new_patient_id}", f"تم حفظ المريض: {new_patient_id}"))
-                try:
-                    st.cache_data.clear()
-                    st.cache_resource.clear()
-                except Exception:
-                    pass
+                st.success(_t(f"Patient saved: {new_patient_id}", f"تم حفظ المريض: {new_patient_id}"))
+                if engine is not None:
+                    engine_add_patient(engine, row)
+                else:
+                    try:
+                        st.cache_data.clear()
+                        st.cache_resource.clear()
+                    except Exception:
+                        pass
                 st.rerun()
             except Exception as e:
                 st.error(_t(f"Failed to save patient: {e}", f"فشل حفظ المريض: {e}"))
@@ -127,291 +259,396 @@ def render_visit_form_page(file_path, engine=None):
     # ============================================
     # Prescription Header Settings (Saved Locally)
     # ============================================
-    profile = load_profile()
-    with st.expander(
-        _t("Prescription Header Settings (saved on this device)", "إعدادات ترويسة الروشتة (محفوظة على هذا الجهاز)"),
-        expanded=False,
-    ):
-        col_a, col_b = st.columns(2)
-        with col_a:
-            clinic_name = st.text_input(_t("Clinic Name", "اسم العيادة"), value=profile.get("clinic_name", ""))
-            doctor_name = st.text_input(_t("Doctor Name", "اسم الطبيب"), value=profile.get("doctor_name", ""))
-            doctor_title_1 = st.text_input(
-                _t("Title Line 1", "اللقب سطر 1"), value=profile.get("doctor_title_1", "")
-            )
-            doctor_title_2 = st.text_input(
-                _t("Title Line 2", "اللقب سطر 2"), value=profile.get("doctor_title_2", "")
-            )
-        with col_b:
-            clinic_address = st.text_input(
-                _t("Clinic Address", "عنوان العيادة"), value=profile.get("clinic_address", "")
-            )
-            clinic_phones = st.text_input(
-                _t("Clinic Phones", "أرقام العيادة"), value=profile.get("clinic_phones", "")
-            )
-            footer_note = st.text_input(
-                _t("Footer Note", "ملاحظة أسفل الروشتة"), value=profile.get("footer_note", "")
-            )
+    @_fragment
+    def _header_settings():
+        profile = load_profile()
+        with st.expander(
+            _t("Prescription Header Settings (saved on this device)", "إعدادات ترويسة الروشتة (محفوظة على هذا الجهاز)"),
+            expanded=False,
+        ):
+            col_a, col_b = st.columns(2)
+            with col_a:
+                clinic_name = st.text_input(_t("Clinic Name", "اسم العيادة"), value=profile.get("clinic_name", ""))
+                doctor_name = st.text_input(_t("Doctor Name", "اسم الطبيب"), value=profile.get("doctor_name", ""))
+                doctor_title_1 = st.text_input(
+                    _t("Title Line 1", "اللقب سطر 1"), value=profile.get("doctor_title_1", "")
+                )
+                doctor_title_2 = st.text_input(
+                    _t("Title Line 2", "اللقب سطر 2"), value=profile.get("doctor_title_2", "")
+                )
+            with col_b:
+                clinic_address = st.text_input(
+                    _t("Clinic Address", "عنوان العيادة"), value=profile.get("clinic_address", "")
+                )
+                clinic_phones = st.text_input(
+                    _t("Clinic Phones", "أرقام العيادة"), value=profile.get("clinic_phones", "")
+                )
+                footer_note = st.text_input(
+                    _t("Footer Note", "ملاحظة أسفل الروشتة"), value=profile.get("footer_note", "")
+                )
 
-        if st.button(_t("Save Header Settings", "حفظ إعدادات الترويسة")):
-            updated = {
-                "clinic_name": clinic_name,
-                "doctor_name": doctor_name,
-                "doctor_title_1": doctor_title_1,
-                "doctor_title_2": doctor_title_2,
-                "clinic_address": clinic_address,
-                "clinic_phones": clinic_phones,
-                "footer_note": footer_note,
-            }
-            save_profile(updated)
-            profile = updated
-            st.success(_t("Header settings saved.", "تم حفظ إعدادات الترويسة."))
+            if st.button(_t("Save Header Settings", "حفظ إعدادات الترويسة")):
+                updated = {
+                    "clinic_name": clinic_name,
+                    "doctor_name": doctor_name,
+                    "doctor_title_1": doctor_title_1,
+                    "doctor_title_2": doctor_title_2,
+                    "clinic_address": clinic_address,
+                    "clinic_phones": clinic_phones,
+                    "footer_note": footer_note,
+                }
+                save_profile(updated)
+                st.success(_t("Header settings saved.", "تم حفظ إعدادات الترويسة."))
+
+    _header_settings()
 
     if patients.empty:
         st.info(_t("Add a patient first to create a visit.", "أضف مريضًا أولاً لإنشاء زيارة."))
         return
 
 
-    (
-        diag_list,
-        cc_list,
-        drug_list,
-        dose_units,
-        freq_units,
-        visit_types,
-        outcome_classes,
-        routes,
-    ) = load_reference_lists(file_path)
+    # ليستات Reference_Data (tuples) – محسوبة مرة لكل نسخة من الشيت
+    ref_all = get_analytics(engine, "ref_lists") if engine is not None else build_reference_lists(ref)
+    ref_lists, ref_pos = ref_all["values"], ref_all["index"]
+    diag_list = ref_lists["diagnoses"]
+    cc_list = ref_lists["complaints"]
+    drug_list = ref_lists["drugs"]
+    dose_units = ref_lists["dose_units"]
+    freq_units = ref_lists["freq_units"]
+    visit_types = ref_lists["visit_types"]
+    outcome_classes = ref_lists["outcomes"]
+    routes = ref_lists["routes"]
 
     # ============================================
     # Auto-ID: زيارة جديدة
     # ============================================
-    new_visit_id = get_next_visit_id(file_path)
+    new_visit_id = engine_next_visit_id(engine) if engine is not None else get_next_visit_id(file_path)
     st.info(_t(f"New visit will be recorded as: **{new_visit_id}**", f"سيتم تسجيل الزيارة برقم: **{new_visit_id}**"))
 
     # ============================================
-    # Select Patient
+    # المريض المختار (من الـ picker فوق)
     # ============================================
-    base_patients = filtered_patients if (search_query.strip() and not filtered_patients.empty) else patients
-
-    try:
-        patient_ids = sorted(base_patients["Patient_ID"].dropna().astype(int).unique())
-    except Exception:
-        patient_ids = sorted(base_patients["Patient_ID"].dropna().unique())
-
-    patient_name_map = {}
-    try:
-        for _, row in base_patients.iterrows():
-            pid = row.get("Patient_ID")
-            try:
-                pid_int = int(pid)
-            except Exception:
-                continue
-            patient_name_map[pid_int] = str(row.get("Patient_Name", ""))
-    except Exception:
-        pass
-
-    selected_id = st.session_state.get("selected_patient_id")
-    if selected_id in patient_ids:
-        default_index = patient_ids.index(selected_id)
-    else:
-        default_index = len(patient_ids) - 1 if len(patient_ids) > 0 else 0
-
-    st.subheader(_t("🧒 Select Patient", "🧒 اختيار المريض"))
-    patient_id = st.selectbox(
-        _t("Patient ID", "رقم المريض"),
-        options=patient_ids,
-        index=default_index,
-        format_func=lambda pid: f"{pid} - {patient_name_map.get(pid, '')}".strip(' -'),
-    )
+    patient_id = st.session_state.get("visit_patient_id")
+    if patient_id not in patient_index["pos_of"]:
+        st.info(_t("Add a patient first to create a visit.", "أضف مريضًا أولاً لإنشاء زيارة."))
+        return
 
     # ============================================
     # التحكم في عدد أسطر الروشتة (Session State)
     # ============================================
     if "rx_rows_count" not in st.session_state:
         st.session_state.rx_rows_count = 1
-
-    # ============================================
-    # فورم بيانات الزيارة + الروشتة
-    # ============================================
-    st.subheader(_t("📅 Visit Details", "📅 بيانات الزيارة"))
-
-    col1, col2, col3 = st.columns(3)
-
-    with col1:
-        visit_date = st.date_input(_t("Visit Date", "تاريخ الزيارة"))
-        source = st.selectbox(_t("Source", "مصدر الزيارة"), ["Clinic", "ER", "Phone"])
-
-    with col2:
-        visit_type = st.selectbox(
-            _t("Visit Type", "نوع الزيارة"),
-            visit_types if visit_types else ["New Case", "Follow-up"],
-        )
-        age_months = st.number_input(
-            _t("Age (months)", "العمر (بالشهور)"), min_value=0, step=1, value=0
-        )
-
-    with col3:
-        weight_kg = st.number_input(_t("Weight (KG)", "الوزن (كجم)"), min_value=0.0, step=0.1, value=0.0)
-        height_cm = st.number_input(_t("Height (CM)", "الطول (سم)"), min_value=0.0, step=0.1, value=0.0)
 
-    st.markdown(_t("### 🩺 Diagnosis & Complaint", "### 🩺 التشخيص والشكوى"))
-
-    col_d1, col_d2, col_d3 = st.columns(3)
-
-    with col_d1:
-        chief = st.selectbox(
-            _t("Chief Complaint", "الشكوى الرئيسية"),
-            [""] + cc_list,
-        )
-
-    with col_d2:
-        diagnosis = st.selectbox(
-            _t("Diagnosis", "التشخيص"),
-            [""] + diag_list,
-        )
-
-    with col_d3:
-        outcome_class = st.selectbox(
-            _t("Outcome Class", "نتيجة الزيارة"),
-            [""] + outcome_classes,
-        )
-
-    col_o1, col_o2 = st.columns(2)
-    with col_o1:
-        outcome_notes = st.text_area(_t("Outcome Notes", "ملاحظات النتيجة"), height=80)
-    with col_o2:
-        recovery_days = st.number_input(
-            _t("Recovery Days", "عدد أيام التحسن / المتابعة"),
-            min_value=0,
-            step=1,
-            value=0,
-        )
-
-    st.markdown("---")
-    st.subheader(_t("💊 Medications (Multi-Drug Prescription)", "💊 الأدوية (روشتة متعددة)"))
-
-    col_add, col_remove = st.columns(2)
-    with col_add:
-        if st.button(_t("➕ Add Drug Line", "➕ إضافة سطر دواء"), use_container_width=True):
-            st.session_state.rx_rows_count += 1
-    with col_remove:
-        if st.button(_t("➖ Remove Last Line", "➖ حذف آخر سطر دواء"), use_container_width=True):
-            if st.session_state.rx_rows_count > 1:
-                st.session_state.rx_rows_count -= 1
+    # ============================================
+    # بيانات الزيارة (fragment) – القيم في Session State والحفظ بيقراها من هناك
+    # ============================================
+    @_fragment
+    def _visit_details():
+        # الوزن / التشخيص اتغير → سطور الأدوية (فحص الجرعة/كجم، تحذيرات التشخيص) لازم تتعمل rerun هي كمان
+        if st.session_state.pop("_visit_rerun_app", False):
+            _rerun_app()
+        st.subheader(_t("📅 Visit Details", "📅 بيانات الزيارة"))
 
-    st.caption(
-        _t(
-            f"Current prescription lines: {st.session_state.rx_rows_count}",
-            f"عدد أسطر الروشتة الحالية: {st.session_state.rx_rows_count}",
-        )
-    )
+        col1, col2, col3 = st.columns(3)
 
-    rx_rows = []
-    for i in range(st.session_state.rx_rows_count):
-        st.markdown(f"**{_t('Medication Line', 'سطر دواء رقم')} {i+1}**")
-        c1, c2, c3, c4 = st.columns([2, 1.2, 1.2, 1.6])
+        with col1:
+            st.date_input(_t("Visit Date", "تاريخ الزيارة"), key="visit_date")
+            st.selectbox(_t("Source", "مصدر الزيارة"), ["Clinic", "ER", "Phone"], key="visit_source")
 
-        with c1:
-            drug_name = st.selectbox(
-                _t(f"Drug Name – Line {i+1}", f"اسم الدواء – سطر {i+1}"),
-                [""] + drug_list,
-                key=f"drug_name_{i}",
+        with col2:
+            st.selectbox(
+                _t("Visit Type", "نوع الزيارة"),
+                visit_types if visit_types else ("New Case", "Follow-up"),
+                key="visit_type",
+            )
+            age_months = st.number_input(
+                _t("Age (months)", "العمر (بالشهور)"), min_value=0, step=1, value=0, key="visit_age_months"
             )
 
-        with c2:
-            dose_value = st.number_input(
-                _t(f"Dose Value – Line {i+1}", f"قيمة الجرعة – سطر {i+1}"),
+        with col3:
+            weight_kg = st.number_input(
+                _t("Weight (KG)", "الوزن (كجم)"),
                 min_value=0.0,
                 step=0.1,
                 value=0.0,
-                key=f"dose_val_{i}",
+                key="visit_weight_kg",
+                on_change=_request_app_rerun,
             )
-            dose_unit = st.selectbox(
-                _t(f"Dose Unit – Line {i+1}", f"وحدة الجرعة – سطر {i+1}"),
-                dose_units if dose_units else ["mg", "ml", "g", "teaspoon", "drop"],
-                key=f"dose_unit_{i}",
+            height_cm = st.number_input(
+                _t("Height (CM)", "الطول (سم)"), min_value=0.0, step=0.1, value=0.0, key="visit_height_cm"
             )
 
-        with c3:
-            freq_value = st.number_input(
-                _t(f"Frequency Value – Line {i+1}", f"قيمة التكرار – سطر {i+1}"),
-                min_value=0.0,
-                step=1.0,
-                value=0.0,
-                key=f"freq_val_{i}",
+        # z-scores النمو للقياس الحالي (WHO LMS)
+        if engine is not None and engine.get("growth_tables") and age_months > 0:
+            patient_id = st.session_state.get("visit_patient_id")
+            gender_rows = patients.loc[patients["Patient_ID"] == patient_id, "Gender"]
+            gender = gender_rows.iloc[0] if not gender_rows.empty else None
+            g = growth_for_measurement(engine["growth_tables"], gender, age_months, weight_kg, height_cm)
+            gc1, gc2, gc3 = st.columns(3)
+            for col, z_col, label in (
+                (gc1, "WFA", _t("Weight-for-age", "الوزن للعمر")),
+                (gc2, "HFA", _t("Height-for-age", "الطول للعمر")),
+                (gc3, "BMI", _t("BMI-for-age", "مؤشر الكتلة للعمر")),
+            ):
+                z = g.get(f"{z_col}_Z")
+                if z is not None and pd.notna(z):
+                    col.metric(label, f"z = {z:+.2f}", f"P{g.get(f'{z_col}_PCT'):.0f}", delta_color="off")
+
+        st.markdown(_t("### 🩺 Diagnosis & Complaint", "### 🩺 التشخيص والشكوى"))
+
+        col_d1, col_d2, col_d3 = st.columns(3)
+
+        with col_d1:
+            st.selectbox(
+                _t("Chief Complaint", "الشكوى الرئيسية"),
+                ("",) + cc_list,
+                key="visit_chief",
             )
-            freq_unit = st.selectbox(
-                _t(f"Frequency Unit – Line {i+1}", f"وحدة التكرار – سطر {i+1}"),
-                freq_units if freq_units else [
-                    "once daily",
-                    "twice daily",
-                    "3 times daily",
-                    "every 6 hours",
-                    "every 8 hours",
-                ],
-                key=f"freq_unit_{i}",
-            )
 
-        with c4:
-            duration_days = st.number_input(
-                _t(f"Duration (days) – Line {i+1}", f"مدة العلاج (أيام) – سطر {i+1}"),
+        with col_d2:
+            st.selectbox(
+                _t("Diagnosis", "التشخيص"),
+                ("",) + diag_list,
+                key="visit_diagnosis",
+                on_change=_request_app_rerun,
+            )
+
+        with col_d3:
+            st.selectbox(
+                _t("Outcome Class", "نتيجة الزيارة"),
+                ("",) + outcome_classes,
+                key="visit_outcome_class",
+            )
+
+        col_o1, col_o2 = st.columns(2)
+        with col_o1:
+            st.text_area(_t("Outcome Notes", "ملاحظات النتيجة"), height=80, key="visit_outcome_notes")
+        with col_o2:
+            st.number_input(
+                _t("Recovery Days", "عدد أيام التحسن / المتابعة"),
                 min_value=0,
                 step=1,
                 value=0,
-                key=f"duration_{i}",
+                key="visit_recovery_days",
             )
-            route = st.selectbox(
-                _t(f"Route – Line {i+1}", f"طريقة الاستخدام – سطر {i+1}"),
-                routes if routes else ["Oral", "IM", "IV", "Neb", "Drops", "Topical"],
-                key=f"route_{i}",
+
+    _visit_details()
+
+    dose_unit_opts = dose_units if dose_units else ("mg", "ml", "g", "teaspoon", "drop")
+    freq_unit_opts = freq_units if freq_units else (
+        "once daily",
+        "twice daily",
+        "3 times daily",
+        "every 6 hours",
+        "every 8 hours",
+    )
+    route_opts = routes if routes else ("Oral", "IM", "IV", "Neb", "Drops", "Topical")
+
+    def _opt_pos(name, opts):
+        # قيمة → موضعها في اختيارات الـ selectbox (من Reference_Data، أو الافتراضي لو الليستة فاضية)
+        return ref_pos[name] if ref_lists[name] else {v: i for i, v in enumerate(opts)}
+
+    dose_unit_pos = _opt_pos("dose_units", dose_unit_opts)
+    freq_unit_pos = _opt_pos("freq_units", freq_unit_opts)
+    route_pos = _opt_pos("routes", route_opts)
+
+    def _prefill_line(i):
+        # أول ما الدكتور يختار الدواء نملأ الجرعة من جدول الاقتراحات (lookup فقط)
+        # (الحقول بدون value= علشان Session State يبقى هو المصدر الوحيد للقيمة)
+        if engine is None:
+            return
+        sug = suggest_dose(
+            get_analytics(engine, "dose_suggestions"),
+            st.session_state.get(f"drug_name_{i}"),
+            st.session_state.get("visit_weight_kg"),
+        )
+        if not sug:
+            return
+        if sug["Dose_Value"] is not None:
+            st.session_state[f"dose_val_{i}"] = float(sug["Dose_Value"])
+        if sug["Dose_Unit"] in dose_unit_pos:
+            st.session_state[f"dose_unit_{i}"] = sug["Dose_Unit"]
+        if sug["Freq_Value"] is not None:
+            st.session_state[f"freq_val_{i}"] = float(sug["Freq_Value"])
+        if sug["Freq_Unit"] in freq_unit_pos:
+            st.session_state[f"freq_unit_{i}"] = sug["Freq_Unit"]
+        if sug["Duration_Days"] is not None:
+            st.session_state[f"duration_{i}"] = int(sug["Duration_Days"])
+        if sug["Route"] in route_pos:
+            st.session_state[f"route_{i}"] = sug["Route"]
+
+    # ============================================
+    # سطور الأدوية (fragment) – إضافة/حذف سطر أو تغيير جرعة بيعيد القسم ده بس
+    # ============================================
+    @_fragment
+    def _medication_lines():
+        st.markdown("---")
+        st.subheader(_t("💊 Medications (Multi-Drug Prescription)", "💊 الأدوية (روشتة متعددة)"))
+
+        col_add, col_remove = st.columns(2)
+        with col_add:
+            if st.button(_t("➕ Add Drug Line", "➕ إضافة سطر دواء"), use_container_width=True):
+                st.session_state.rx_rows_count += 1
+        with col_remove:
+            if st.button(_t("➖ Remove Last Line", "➖ حذف آخر سطر دواء"), use_container_width=True):
+                if st.session_state.rx_rows_count > 1:
+                    st.session_state.rx_rows_count -= 1
+
+        st.caption(
+            _t(
+                f"Current prescription lines: {st.session_state.rx_rows_count}",
+                f"عدد أسطر الروشتة الحالية: {st.session_state.rx_rows_count}",
             )
-            instructions = st.text_input(
-                _t(f"Additional Instructions – Line {i+1}", f"تعليمات إضافية – سطر {i+1}"),
-                key=f"instructions_{i}",
+        )
+
+        weight_kg = st.session_state.get("visit_weight_kg", 0.0)
+        for i in range(st.session_state.rx_rows_count):
+            st.markdown(f"**{_t('Medication Line', 'سطر دواء رقم')} {i+1}**")
+            c1, c2, c3, c4 = st.columns([2, 1.2, 1.2, 1.6])
+
+            with c1:
+                drug_name = st.selectbox(
+                    _t(f"Drug Name – Line {i+1}", f"اسم الدواء – سطر {i+1}"),
+                    ("",) + drug_list,
+                    key=f"drug_name_{i}",
+                    on_change=_prefill_line,
+                    args=(i,),
+                )
+
+            with c2:
+                dose_value = st.number_input(
+                    _t(f"Dose Value – Line {i+1}", f"قيمة الجرعة – سطر {i+1}"),
+                    min_value=0.0,
+                    step=0.1,
+                    key=f"dose_val_{i}",
+                )
+                dose_unit = st.selectbox(
+                    _t(f"Dose Unit – Line {i+1}", f"وحدة الجرعة – سطر {i+1}"),
+                    dose_unit_opts,
+                    key=f"dose_unit_{i}",
+                )
+
+            with c3:
+                st.number_input(
+                    _t(f"Frequency Value – Line {i+1}", f"قيمة التكرار – سطر {i+1}"),
+                    min_value=0.0,
+                    step=1.0,
+                    key=f"freq_val_{i}",
+                )
+                st.selectbox(
+                    _t(f"Frequency Unit – Line {i+1}", f"وحدة التكرار – سطر {i+1}"),
+                    freq_unit_opts,
+                    key=f"freq_unit_{i}",
+                )
+
+            with c4:
+                st.number_input(
+                    _t(f"Duration (days) – Line {i+1}", f"مدة العلاج (أيام) – سطر {i+1}"),
+                    min_value=0,
+                    step=1,
+                    key=f"duration_{i}",
+                )
+                st.selectbox(
+                    _t(f"Route – Line {i+1}", f"طريقة الاستخدام – سطر {i+1}"),
+                    route_opts,
+                    key=f"route_{i}",
+                )
+                st.text_input(
+                    _t(f"Additional Instructions – Line {i+1}", f"تعليمات إضافية – سطر {i+1}"),
+                    key=f"instructions_{i}",
+                )
+
+            if engine is not None and drug_name and dose_value > 0:
+                dose_score = score_dose(
+                    engine.get("dose_live_stats"),
+                    drug_name,
+                    dose_unit,
+                    dose_value,
+                    weight_kg,
+                    min_cases=DOSE_MIN_CASES,
+                )
+                if dose_score and abs(dose_score["z"]) > DOSE_Z_THRESHOLD:
+                    st.warning(
+                        _t(
+                            f"⚠️ Unusual dose: {dose_score['dose_per_kg']:.2f} {dose_unit}/kg "
+                            f"(clinic average {dose_score['mean_per_kg']:.2f}, z = {dose_score['z']:.1f}).",
+                            f"⚠️ جرعة غير معتادة: {dose_score['dose_per_kg']:.2f} {dose_unit}/كجم "
+                            f"(متوسط العيادة {dose_score['mean_per_kg']:.2f}، z = {dose_score['z']:.1f}).",
+                        )
+                    )
+
+            st.markdown("---")
+
+        # فحص التداخلات الدوائية للروشتة كلها
+        if engine is not None:
+            rx_rows = _rx_rows_from_state(st.session_state.rx_rows_count)
+            risky = regimen_interactions(
+                engine.get("interactions"),
+                [r["Drug_Name"] for r in rx_rows if r["Drug_Name"]],
             )
-
-        st.markdown("---")
-
-        rx_rows.append(
-            dict(
-                Drug_Name=drug_name,
-                Dose_Value=dose_value,
-                Dose_Unit=dose_unit,
-                Freq_Value=freq_value,
-                Freq_Unit=freq_unit,
-                Duration_Days=duration_days,
-                Route=route,
-                Instructions=instructions,
-            )
-        )
-
+            for _, pair in risky.iterrows():
+                msg = _t(
+                    f"⚠️ Interaction ({pair['Severity']}): {pair['Drug_A']} + {pair['Drug_B']}",
+                    f"⚠️ تداخل دوائي ({pair['Severity']}): {pair['Drug_A']} + {pair['Drug_B']}",
+                )
+                if pair["Note"]:
+                    msg += f" – {pair['Note']}"
+                if pair["Severity"] == "major":
+                    st.error(msg)
+                else:
+                    st.warning(msg)
+
+            # تحذيرات دوا + تشخيص (زي NSAID مع الجفاف) – جدول منفصل عن التداخلات
+            risky = regimen_cautions(
+                engine.get("cautions"),
+                st.session_state.get("visit_diagnosis"),
+                [r["Drug_Name"] for r in rx_rows if r["Drug_Name"]],
+            )
+            for _, row in risky.iterrows():
+                msg = _t(
+                    f"⚠️ Caution ({row['Severity']}): {row['Drug_Name']} with {row['Diagnosis']}",
+                    f"⚠️ تحذير ({row['Severity']}): {row['Drug_Name']} مع {row['Diagnosis']}",
+                )
+                if row["Note"]:
+                    msg += f" – {row['Note']}"
+                if row["Severity"] == "major":
+                    st.error(msg)
+                else:
+                    st.warning(msg)
+
+    _medication_lines()
+
     submitted = st.button(_t("Save Visit + Prescription", "حفظ الزيارة + الروشتة"))
 
     # ============================================
     # بعد الضغط على زر الحفظ
     # ============================================
     if submitted:
-        if not diagnosis:
-            st.error(_t("Please choose a diagnosis.", "من فضلك اختر تشخيص."))
-            return
+        # كل الأقسام كتبت قيمها في Session State – الحفظ مرة واحدة من هناك
+        ss = st.session_state
+        visit_date = ss.get("visit_date")
+        diagnosis = ss.get("visit_diagnosis", "")
+        if not diagnosis:
+            st.error(_t("Please choose a diagnosis.", "من فضلك اختر تشخيص."))
+            return
 
         # تجهيز صف الزيارة للحفظ في شيت Visits
         visit_row = {
             "Visit_ID": int(new_visit_id),
             "Patient_ID": int(patient_id),
             "Visit_Date": visit_date,
-            "Visit_Type": visit_type,
-            "Source": source,
-            "Age_Months": age_months,
-            "Weight_KG": weight_kg,
-            "Height_CM": height_cm,
-            "Chief_Complaint": chief,
+            "Visit_Type": ss.get("visit_type"),
+            "Source": ss.get("visit_source"),
+            "Age_Months": ss.get("visit_age_months", 0),
+            "Weight_KG": ss.get("visit_weight_kg", 0.0),
+            "Height_CM": ss.get("visit_height_cm", 0.0),
+            "Chief_Complaint": ss.get("visit_chief", ""),
             "Diagnosis": diagnosis,
-            "Outcome_Class": outcome_class,
-            "Outcome_Notes": outcome_notes,
-            "Recovery_Days": recovery_days,
+            "Outcome_Class": ss.get("visit_outcome_class", ""),
+            "Outcome_Notes": ss.get("visit_outcome_notes", ""),
+            "Recovery_Days": ss.get("visit_recovery_days", 0),
         }
+        rx_rows = _rx_rows_from_state(ss.rx_rows_count)
 
         # تجهيز روشتة الأدوية للحفظ في شيت Visit_Drugs
         drug_rows_to_save = []
@@ -478,12 +715,16 @@ def render_visit_form_page(file_path, engine=None):
             )
         )
 
-        # تنظيف الكاش علشان باقي الصفحات تشوف التحديث
-        try:
-            st.cache_data.clear()
-            st.cache_resource.clear()
-        except Exception:
-            pass
+        # تحديث الـ Engine بالزيارة الجديدة علشان باقي الصفحات تشوف التحديث
+        # (بيبطّل التحليلات المتأثرة بس بدل إعادة بناء كل حاجة)
+        if engine is not None:
+            engine_add_visit(engine, visit_row, drug_rows_to_save)
+        else:
+            try:
+                st.cache_data.clear()
+                st.cache_resource.clear()
+            except Exception:
+                pass
 
 
     # ============================================
@@ -491,79 +732,83 @@ def render_visit_form_page(file_path, engine=None):
     # ============================================
     # Print Prescription (HTML Report)
     # ============================================
-    st.markdown("---")
-    st.subheader(_t("🖨️ Prescription Report", "🖨️ تقرير الروشتة"))
-    payload = st.session_state.get("last_visit_payload")
-    if payload:
-        report_html = build_prescription_html(
-            load_profile(),
-            payload["visit_info"],
-            payload["patient_info"],
-            payload["drugs"],
-            lang=lang,
-        )
+    @_fragment
+    def _prescription_preview():
+        st.markdown("---")
+        st.subheader(_t("🖨️ Prescription Report", "🖨️ تقرير الروشتة"))
+        payload = st.session_state.get("last_visit_payload")
+        if payload:
+            report_html = build_prescription_html(
+                load_profile(),
+                payload["visit_info"],
+                payload["patient_info"],
+                payload["drugs"],
+                lang=lang,
+            )
 
-        with st.expander(_t("Preview Prescription", "معاينة الروشتة")):
-            components.html(report_html, height=820, scrolling=True)
+            with st.expander(_t("Preview Prescription", "معاينة الروشتة")):
+                components.html(report_html, height=820, scrolling=True)
 
-        open_label = _t("Open Prescription in New Tab", "فتح الروشتة في تبويب جديد")
-        open_alert = _t(
-            "Pop-ups blocked. Please allow pop-ups and try again.",
-            "المتصفح منع فتح نافذة جديدة. فعّل Pop-ups ثم جرب مرة أخرى."
-        )
+            open_label = _t("Open Prescription in New Tab", "فتح الروشتة في تبويب جديد")
+            open_alert = _t(
+                "Pop-ups blocked. Please allow pop-ups and try again.",
+                "المتصفح منع فتح نافذة جديدة. فعّل Pop-ups ثم جرب مرة أخرى."
+            )
 
-        b64 = base64.b64encode(report_html.encode("utf-8")).decode("utf-8")
-        open_js = f"""
-<script>
-function openPrescriptionTab(){{
-  const b64 = "{b64}";
-  const binary = atob(b64);
-  const bytes = new Uint8Array(binary.length);
-  for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
-  const html = new TextDecoder("utf-8").decode(bytes);
-  const w = window.open("about:blank", "_blank");
-  if(!w){{ alert("{open_alert}"); return; }}
-  w.document.open();
-  w.document.write(html);
-  w.document.close();
-  w.focus();
-}}
-</script>
-<button
-  onclick="openPrescriptionTab()"
-  style="background:#111827;color:#fff;border:none;border-radius:10px;padding:10px 14px;font-weight:900;cursor:pointer;"
->
-  🖨️ {open_label}
-</button>
-"""
-        components.html(open_js, height=70)
-
-        if st.button(_t("Generate PDF (Optional)", "توليد PDF (اختياري)")):
-            try:
-                pdf_path = generate_prescription_pdf(
-                    load_profile(),
-                    payload["visit_info"],
-                    payload["patient_info"],
-                    payload["drugs"],
-                )
-                st.session_state["last_prescription_pdf"] = str(pdf_path)
-                st.success(_t("PDF generated.", "تم توليد ملف PDF."))
-            except Exception as exc:
-                st.error(_t(f"Failed to generate PDF: {exc}", f"فشل توليد PDF: {exc}"))
-
-        pdf_path_str = st.session_state.get("last_prescription_pdf")
-        if pdf_path_str:
-            pdf_path = Path(pdf_path_str)
-            if pdf_path.exists():
-                st.download_button(
-                    _t("Download PDF", "تحميل PDF"),
-                    data=pdf_path.read_bytes(),
-                    file_name=pdf_path.name,
-                    mime="application/pdf",
-                    use_container_width=True,
-                )
-    else:
-        st.info(_t("Save a visit first to enable prescription printing.", "احفظ الزيارة أولًا لتفعيل طباعة الروشتة."))
+            b64 = base64.b64encode(report_html.encode("utf-8")).decode("utf-8")
+            open_js = f"""
+    <script>
+    function openPrescriptionTab(){{
+      const b64 = "{b64}";
+      const binary = atob(b64);
+      const bytes = new Uint8Array(binary.length);
+      for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+      const html = new TextDecoder("utf-8").decode(bytes);
+      const w = window.open("about:blank", "_blank");
+      if(!w){{ alert("{open_alert}"); return; }}
+      w.document.open();
+      w.document.write(html);
+      w.document.close();
+      w.focus();
+    }}
+    </script>
+    <button
+      onclick="openPrescriptionTab()"
+      style="background:#111827;color:#fff;border:none;border-radius:10px;padding:10px 14px;font-weight:900;cursor:pointer;"
+    >
+      🖨️ {open_label}
+    </button>
+    """
+            components.html(open_js, height=70)
+
+            if st.button(_t("Generate PDF (Optional)", "توليد PDF (اختياري)")):
+                try:
+                    pdf_path = generate_prescription_pdf(
+                        load_profile(),
+                        payload["visit_info"],
+                        payload["patient_info"],
+                        payload["drugs"],
+                    )
+                    st.session_state["last_prescription_pdf"] = str(pdf_path)
+                    st.success(_t("PDF generated.", "تم توليد ملف PDF."))
+                except Exception as exc:
+                    st.error(_t(f"Failed to generate PDF: {exc}", f"فشل توليد PDF: {exc}"))
+
+            pdf_path_str = st.session_state.get("last_prescription_pdf")
+            if pdf_path_str:
+                pdf_path = Path(pdf_path_str)
+                if pdf_path.exists():
+                    st.download_button(
+                        _t("Download PDF", "تحميل PDF"),
+                        data=pdf_path.read_bytes(),
+                        file_name=pdf_path.name,
+                        mime="application/pdf",
+                        use_container_width=True,
+                    )
+        else:
+            st.info(_t("Save a visit first to enable prescription printing.", "احفظ الزيارة أولًا لتفعيل طباعة الروشتة."))
+
+    _prescription_preview()
 
     # Privacy / Session
     # ============================================
@@ -11,3 +11,23 @@ FILE_PATH = BASE_DIR / "clinic_data2.xlsx"
 
 # مسار ملف الموديل ML
 MODEL_PATH = BASE_DIR / "model_drug_reco.pkl"
+
+# تحذير الجرعة الشاذة في فورم الزيارة (|z| أكبر من الحد ده)
+DOSE_Z_THRESHOLD = 3.0
+DOSE_MIN_CASES = 5
+
+# كاشف الزيادة المفاجئة في تشخيص (Outbreak) – نافذة أيام + EWMA baseline
+OUTBREAK_WINDOW_DAYS = 7
+OUTBREAK_ALPHA = 0.1
+OUTBREAK_Z = 3.0
+OUTBREAK_MIN_CASES = 3
+OUTBREAK_WARMUP_DAYS = 28
+
+# جداول النمو WHO (LMS) – شوف assets/growth/README.txt
+GROWTH_DIR = BASE_DIR / "assets" / "growth"
+
+# جدول التداخلات الدوائية (اختياري) – Drug_A, Drug_B, Severity, Note (+ Source)
+INTERACTIONS_PATH = BASE_DIR / "assets" / "reference" / "drug_interactions.csv"
+
+# تحذيرات دوا + تشخيص (مش تداخل بين دوائين) – Drug, Diagnosis, Severity, Note
+CAUTIONS_PATH = BASE_DIR / "assets" / "reference" / "drug_cautions.csv"
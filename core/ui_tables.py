@@ -0,0 +1,110 @@
+# core/ui_tables.py
+# جدول بفلتر/ترتيب/صفحات على السيرفر – الصفحة الظاهرة بس بتتبعت للمتصفح
+
+import math
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def _filter_positions(df: pd.DataFrame, query: str) -> np.ndarray:
+    positions = np.arange(len(df))
+    if not query:
+        return positions
+    mask = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object or pd.api.types.is_string_dtype(s):
+            mask |= s.astype(str).str.contains(query, case=False, regex=False, na=False).to_numpy()
+        else:
+            mask |= (s.astype(str) == query).to_numpy()
+    return positions[mask]
+
+
+def _sort_positions(df: pd.DataFrame, positions: np.ndarray, col, ascending: bool) -> np.ndarray:
+    if col is None or not len(positions):
+        return positions
+    s = df[col].iloc[positions].reset_index(drop=True)
+    try:
+        order = s.sort_values(ascending=ascending, kind="mergesort", na_position="last").index
+    except TypeError:
+        # أنواع مختلفة في نفس العمود
+        order = s.astype(str).sort_values(ascending=ascending, kind="mergesort").index
+    return positions[order.to_numpy()]
+
+
+def _view_positions(df: pd.DataFrame, key: str, version, query: str, sort_col, ascending: bool) -> np.ndarray:
+    # الفلتر + الترتيب بيتحسبوا تاني بس لو الداتا (version) أو أدوات الجدول اتغيرت؛
+    # التنقل بين الصفحات = slice على المواضع المحفوظة
+    state_key = f"{key}__view"
+    controls = (query, sort_col, ascending)
+    signature = (version, len(df), tuple(df.columns)) + controls
+    cached = st.session_state.get(state_key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    positions = _sort_positions(df, _filter_positions(df, query), sort_col, ascending)
+    st.session_state[state_key] = (signature, positions)
+    # فلتر / ترتيب جديد → الصفحة الأولى (تحديث الداتا بيحافظ على الصفحة)
+    if cached is not None and cached[0][-3:] != controls:
+        st.session_state.pop(f"{key}__page", None)
+    return positions
+
+
+def render_paginated_table(
+    df: pd.DataFrame,
+    key: str,
+    version=None,
+    page_size: int = 25,
+    filterable: bool = True,
+    sortable: bool = True,
+    hide_index: bool = True,
+) -> None:
+    """
+    فلتر / ترتيب / صفحات على السيرفر لجدول في الذاكرة – الصفحة الظاهرة بس بتتبعت.
+    `version` لازم يتغير مع أي تغيير في محتوى `df`
+    (نسخ داتا الـ Engine، المريض المختار، ...).
+    """
+    if df is None or df.empty:
+        st.info("لا توجد بيانات.")
+        return
+
+    c1, c2, c3, c4 = st.columns([2, 1.5, 1, 1])
+    query = ""
+    sort_col = None
+    ascending = True
+    if filterable:
+        with c1:
+            query = st.text_input("فلتر (Filter)", key=f"{key}__filter", placeholder="اكتب للفلترة…").strip()
+    if sortable:
+        with c2:
+            sort_col = st.selectbox("ترتيب حسب (Sort by)", [None] + list(df.columns), key=f"{key}__sort",
+                                    format_func=lambda c: "—" if c is None else str(c))
+        with c3:
+            ascending = st.checkbox("تصاعدي (Ascending)", value=True, key=f"{key}__asc")
+    with c4:
+        default = PAGE_SIZES.index(page_size) if page_size in PAGE_SIZES else 0
+        page_size = st.selectbox("صفوف / صفحة (Rows / page)", PAGE_SIZES, index=default, key=f"{key}__size")
+
+    positions = _view_positions(df, key, version, query, sort_col, ascending)
+    total = len(positions)
+    if not total:
+        st.info("لا توجد صفوف مطابقة للفلتر.")
+        return
+
+    n_pages = max(math.ceil(total / page_size), 1)
+    page = 1
+    if st.session_state.get(f"{key}__page", 1) > n_pages:
+        # الداتا قلت عن الصفحة الحالية
+        st.session_state.pop(f"{key}__page", None)
+    if n_pages > 1:
+        page = int(st.number_input(f"الصفحة (من {n_pages})", min_value=1, max_value=n_pages,
+                                   value=1, step=1, key=f"{key}__page"))
+    start = (min(page, n_pages) - 1) * page_size
+    end = min(start + page_size, total)
+
+    st.dataframe(df.iloc[positions[start:end]], use_container_width=True, hide_index=hide_index)
+    st.caption(f"الصفوف {start + 1:,}–{end:,} من {total:,}" + (f" (بعد الفلترة من {len(df):,})" if query else ""))
@@ -1,27 +1,68 @@
 # core/utils_analytics.py
 # مسؤول عن التحليلات A-1..A-9 + الجرعات + تكرار المرض
 
+import heapq
+import threading
+from collections import Counter
+
 import pandas as pd
 import numpy as np
 
-from .utils_data import df_base_clean
+from .utils_data import df_base_clean, weight_band_codes, build_reference_lists
+from .utils_drugs import unmatched_drug_names
+from .utils_growth import growth_zscores
+from .utils_quality import profile_workbook
+from .utils_query import build_query_index
 
 
 # =========================================================
-# A-1: فعالية الدواء لكل تشخيص
+# أساس مشترك لـ A-1/A-2/A-3: is_cured مرة واحدة + تجميعات بدون lambda
 # =========================================================
-def analysis_a1(data_merged):
-    df = df_base_clean(data_merged)
-    out = (
-        df.groupby(["Diagnosis", "Drug_Name"])
+_ANALYTICS_COLS = [
+    "Patient_ID", "Diagnosis", "Drug_Name", "Chief_Complaint",
+    "Outcome_Class", "Recovery_Days",
+]
+_PARTIAL_COLS = ["rows", "total_cases", "cured_cases", "rec_sum", "rec_n"]
+
+
+def _analytics_base(data_merged, extra_cols=()):
+    """
+    نسخة واحدة بالأعمدة المطلوبة فقط + عمود is_cured (bool).
+    """
+    df = df_base_clean(data_merged.reindex(columns=_ANALYTICS_COLS + list(extra_cols)))
+    df["is_cured"] = df["Outcome_Class"].eq("Cured")
+    return df
+
+
+def _partials(df, keys):
+    """
+    مجاميع جزئية قابلة للجمع (rows, cured, recovery sum/count)
+    علشان نشتق منها cure_rate و avg_recovery لأي مستوى تجميع.
+    """
+    return (
+        df.groupby(keys)
         .agg(
+            rows=("is_cured", "size"),
             total_cases=("Patient_ID", "count"),
-            cured_cases=("Outcome_Class", lambda x: (x == "Cured").sum()),
-            cure_rate=("Outcome_Class", lambda x: (x == "Cured").mean()),
-            avg_recovery=("Recovery_Days", "mean"),
+            cured_cases=("is_cured", "sum"),
+            rec_sum=("Recovery_Days", "sum"),
+            rec_n=("Recovery_Days", "count"),
         )
         .reset_index()
     )
+
+
+def _derive_rates(p):
+    out = p.drop(columns=["rows", "rec_sum", "rec_n"])
+    out["total_cases"] = p["total_cases"].astype(int)
+    out["cured_cases"] = p["cured_cases"].astype(int)
+    out["cure_rate"] = p["cured_cases"] / p["rows"].where(p["rows"] > 0)
+    out["avg_recovery"] = p["rec_sum"] / p["rec_n"].where(p["rec_n"] > 0)
+    return out
+
+
+def _finish_a1(p):
+    out = _derive_rates(p)
     out["cure_rate"] = out["cure_rate"].fillna(0)
     out["avg_recovery"] = out["avg_recovery"].fillna(999)
     return out.sort_values(
@@ -30,21 +71,22 @@ def analysis_a1(data_merged):
     )
 
 
+# =========================================================
+# A-1: فعالية الدواء لكل تشخيص
+# =========================================================
+def analysis_a1(data_merged):
+    return _finish_a1(_partials(_analytics_base(data_merged), ["Diagnosis", "Drug_Name"]))
+
+
 # =========================================================
 # A-2: نسبة الشفاء حسب التشخيص + الشكوى الرئيسية
 # =========================================================
 def analysis_a2(data_merged):
-    df = df_base_clean(data_merged)
-    out = (
-        df.groupby(["Diagnosis", "Chief_Complaint"])
-        .agg(
-            total_cases=("Patient_ID", "count"),
-            cured_cases=("Outcome_Class", lambda x: (x == "Cured").sum()),
-            cure_rate=("Outcome_Class", lambda x: (x == "Cured").mean()),
-            avg_recovery=("Recovery_Days", "mean"),
-        )
-        .reset_index()
-    )
+    return _finish_a2(_partials(_analytics_base(data_merged), ["Diagnosis", "Chief_Complaint"]))
+
+
+def _finish_a2(p):
+    out = _derive_rates(p)
     out["cure_rate"] = (out["cure_rate"] * 100).round(1)
     out["avg_recovery"] = out["avg_recovery"].round(2)
     return out.sort_values(["Diagnosis", "cure_rate"], ascending=[True, False])
@@ -54,17 +96,11 @@ def analysis_a2(data_merged):
 # A-3: Score لسرعة وموثوقية الدواء
 # =========================================================
 def analysis_a3(data_merged):
-    df = df_base_clean(data_merged)
-    out = (
-        df.groupby("Drug_Name")
-        .agg(
-            total_cases=("Patient_ID", "count"),
-            cured_cases=("Outcome_Class", lambda x: (x == "Cured").sum()),
-            cure_rate=("Outcome_Class", lambda x: (x == "Cured").mean()),
-            avg_recovery=("Recovery_Days", "mean"),
-        )
-        .reset_index()
-    )
+    return _finish_a3(_partials(_analytics_base(data_merged), ["Drug_Name"]))
+
+
+def _finish_a3(p):
+    out = _derive_rates(p)
     out["avg_recovery"] = out["avg_recovery"].fillna(999)
     out["cure_rate"] = out["cure_rate"].fillna(0)
 
@@ -113,28 +149,206 @@ def dose_ranges(data_merged):
 
 
 # =========================================================
-# A-7: جرعات شاذة (Outliers)
+# A-6b: جدول اقتراح الجرعة (دواء × شريحة وزن × وحدة)
 # =========================================================
-def dose_outliers(data_merged, z=3):
-    temp = data_merged.dropna(subset=["Drug_Name", "Dose_per_KG"]).copy()
-    if temp.empty:
-        return pd.DataFrame()
+def _modal(df, keys, col):
+    """
+    القيمة الأكثر تكرارًا من col لكل مجموعة keys (بدون lambda).
+    """
+    counts = (
+        df.dropna(subset=[col])
+        .groupby(keys + [col])
+        .size()
+        .reset_index(name="_n")
+        .sort_values("_n", ascending=False, kind="mergesort")
+        .drop_duplicates(keys)
+    )
+    return counts.drop(columns="_n")
 
-    out_list = []
-    for drug, g in temp.groupby("Drug_Name"):
-        if len(g) < 3:
-            continue
-        m = g["Dose_per_KG"].mean()
-        s = g["Dose_per_KG"].std()
-        if s == 0 or np.isnan(s):
+
+def dose_suggestion_table(data_merged):
+    """
+    يرجّع:
+    - table: DataFrame (Drug_Name, Weight_Band, Dose_Unit, ...)
+    - lookup: {(drug, band): row dict} – band = -1 يعني كل الأوزان
+    الوحدة المختارة لكل (دواء، شريحة) هي الأكثر استخدامًا.
+    """
+    df = df_base_clean(data_merged).dropna(
+        subset=["Dose_Value", "Dose_Unit", "Weight_KG"]
+    )
+    df = df[(df["Drug_Name"] != "Unknown") & (df["Weight_KG"] > 0)]
+    if df.empty:
+        return {"table": pd.DataFrame(), "lookup": {}}
+
+    df["Dose_per_KG"] = df["Dose_Value"] / df["Weight_KG"]
+    banded = df.assign(Weight_Band=weight_band_codes(df["Weight_KG"]))
+    all_w = df.assign(Weight_Band=-1)
+    df = pd.concat([banded, all_w], ignore_index=True)
+
+    keys = ["Drug_Name", "Weight_Band"]
+    df = df.merge(_modal(df, keys, "Dose_Unit"), on=keys + ["Dose_Unit"], how="inner")
+
+    out = (
+        df.groupby(keys + ["Dose_Unit"])
+        .agg(
+            cases=("Dose_Value", "size"),
+            dose=("Dose_Value", "median"),
+            dose_per_kg=("Dose_per_KG", "median"),
+            freq_value=("Freq_Value", "median"),
+            duration_days=("Duration_Days", "median"),
+        )
+        .reset_index()
+    )
+    for col in ("Freq_Unit", "Route"):
+        out = out.merge(_modal(df, keys, col), on=keys, how="left")
+
+    out["dose"] = out["dose"].round(2)
+    out["dose_per_kg"] = out["dose_per_kg"].round(3)
+
+    lookup = {
+        (r["Drug_Name"], int(r["Weight_Band"])): r
+        for r in out.to_dict("records")
+    }
+    return {"table": out, "lookup": lookup}
+
+
+def suggest_dose(suggestions, drug_name, weight_kg=None):
+    """
+    O(1) lookup: يرجّع dict بالجرعة المقترحة (أو None).
+    لو الوزن معروف الجرعة = dose_per_kg × الوزن، وإلا الوسيط التاريخي.
+    """
+    if not suggestions or not drug_name:
+        return None
+    lookup = suggestions["lookup"]
+    band = int(weight_band_codes([weight_kg])[0]) if weight_kg else -1
+    row = lookup.get((drug_name, band)) or lookup.get((drug_name, -1))
+    if row is None:
+        return None
+
+    dose = row["dose"]
+    if weight_kg and weight_kg > 0 and pd.notna(row["dose_per_kg"]):
+        dose = round(float(row["dose_per_kg"]) * float(weight_kg), 2)
+    return {
+        "Dose_Value": float(dose) if pd.notna(dose) else None,
+        "Dose_Unit": row["Dose_Unit"],
+        "Freq_Value": float(row["freq_value"]) if pd.notna(row["freq_value"]) else None,
+        "Freq_Unit": row.get("Freq_Unit"),
+        "Duration_Days": int(round(row["duration_days"])) if pd.notna(row["duration_days"]) else None,
+        "Route": row.get("Route"),
+        "cases": int(row["cases"]),
+    }
+
+
+# =========================================================
+# A-7b: إحصائيات الجرعة لكل كيلو (running mean/std) للتحذير اللحظي
+# =========================================================
+def _dose_per_kg_frame(data_merged):
+    df = data_merged.dropna(subset=["Drug_Name", "Dose_Value", "Dose_Unit", "Weight_KG"])
+    df = df[df["Weight_KG"] > 0]
+    return df.assign(Dose_per_KG=df["Dose_Value"] / df["Weight_KG"])
+
+
+def dose_running_stats(data_merged):
+    """
+    {(drug, unit): {"n", "mean", "m2"}} – m2 = مجموع مربعات الانحراف (Welford)
+    علشان نقدر نضيف سطور جديدة من غير ما نرجع للتاريخ كله.
+    """
+    df = _dose_per_kg_frame(data_merged)
+    if df.empty:
+        return {}
+    g = (
+        df.groupby(["Drug_Name", "Dose_Unit"])["Dose_per_KG"]
+        .agg(n="count", mean="mean", var="var")
+        .reset_index()
+    )
+    g["m2"] = g["var"].fillna(0) * (g["n"] - 1)
+    return {
+        (r.Drug_Name, r.Dose_Unit): {"n": int(r.n), "mean": float(r.mean), "m2": float(r.m2)}
+        for r in g.itertuples(index=False)
+    }
+
+
+def update_dose_stats(stats, new_rows):
+    """
+    يدمج سطور جديدة (DataFrame فيه Drug_Name/Dose_Value/Dose_Unit/Weight_KG)
+    في الإحصائيات بخوارزمية Chan (parallel Welford) – O(السطور الجديدة).
+    """
+    add = dose_running_stats(new_rows)
+    for key, b in add.items():
+        a = stats.get(key)
+        if a is None:
+            stats[key] = b
             continue
-        gg = g[(g["Dose_per_KG"] - m).abs() > (z * s)]
-        if not gg.empty:
-            out_list.append(gg)
+        n = a["n"] + b["n"]
+        delta = b["mean"] - a["mean"]
+        a["m2"] = a["m2"] + b["m2"] + delta * delta * a["n"] * b["n"] / n
+        a["mean"] = a["mean"] + delta * b["n"] / n
+        a["n"] = n
+    return stats
 
-    if out_list:
-        return pd.concat(out_list).sort_values("Dose_per_KG", ascending=False)
-    return pd.DataFrame()
+
+def score_dose(stats, drug_name, dose_unit, dose_value, weight_kg, min_cases=5):
+    """
+    z-score لجرعة واحدة مقابل تاريخ نفس الدواء/الوحدة – O(1).
+    يرجّع None لو مفيش تاريخ كفاية.
+    """
+    if not stats or not drug_name or not dose_value or not weight_kg or weight_kg <= 0:
+        return None
+    s = stats.get((drug_name, dose_unit))
+    if s is None or s["n"] < min_cases:
+        return None
+    std = (s["m2"] / (s["n"] - 1)) ** 0.5
+    if std == 0:
+        return None
+    per_kg = float(dose_value) / float(weight_kg)
+    return {
+        "z": (per_kg - s["mean"]) / std,
+        "dose_per_kg": per_kg,
+        "mean_per_kg": s["mean"],
+        "std_per_kg": std,
+        "cases": s["n"],
+    }
+
+
+# =========================================================
+# A-7: جرعات شاذة (Outliers)
+# =========================================================
+_OUTLIER_COLS = [
+    "Visit_ID", "Patient_ID", "Visit_Date", "Drug_Name", "Dose_Value", "Dose_Unit",
+    "Weight_KG", "Dose_per_KG", "median_dose_per_kg", "dose_z",
+]
+
+
+def dose_outliers(data_merged, z=3, min_cases=3):
+    """
+    كل سطور الجرعات الشاذة في العيادة في pass واحد (بدون loop على الأدوية):
+    Dose_per_KG بيتحسب مرة، والإحصائيات لكل (دواء، وحدة) بـ groupby().transform.
+    الأساس robust z = 0.6745·(x − median)/MAD، ولو MAD = 0 نرجع لـ mean/std.
+    """
+    df = _dose_per_kg_frame(data_merged)
+    if df.empty:
+        return pd.DataFrame(columns=_OUTLIER_COLS)
+
+    x = df["Dose_per_KG"]
+    groups = [df["Drug_Name"], df["Dose_Unit"]]
+    g = x.groupby(groups)
+    n = g.transform("count")
+    med = g.transform("median")
+    mad = (x - med).abs().groupby(groups).transform("median")
+    mean = g.transform("mean")
+    std = g.transform("std")
+
+    robust_z = 0.6745 * (x - med) / mad.where(mad > 0)
+    classic_z = (x - mean) / std.where(std > 0)
+    score = robust_z.fillna(classic_z)
+
+    mask = (n >= min_cases) & (score.abs() > z)
+    out = df.loc[mask].assign(
+        median_dose_per_kg=med[mask].round(3),
+        dose_z=score[mask].round(2),
+    )
+    out = out.reindex(columns=_OUTLIER_COLS)
+    return out.loc[out["dose_z"].abs().sort_values(ascending=False).index]
 
 
 # =========================================================
@@ -152,26 +366,51 @@ def data_quality_report(data_merged):
 # =========================================================
 # A-4/A-5: تكرار المرض Recurrence
 # =========================================================
-def recurrence_table(patient_id, data_merged):
-    temp = data_merged[
-        (data_merged["Patient_ID"] == patient_id)
-        & (data_merged["Visit_Type"] == "New Case")
-    ].copy()
+_REC_COLS = ["Diagnosis", "Visit_Date", "days_since_last", "episode_no"]
 
-    if temp.empty:
-        return pd.DataFrame(
-            columns=["Diagnosis", "Visit_Date", "days_since_last", "episode_no"]
-        )
 
-    temp = temp.sort_values(["Diagnosis", "Visit_Date"])
-    temp["Prev_Date"] = temp.groupby("Diagnosis")["Visit_Date"].shift(1)
-    temp["days_since_last"] = (temp["Visit_Date"] - temp["Prev_Date"]).dt.days
-    temp["episode_no"] = temp.groupby("Diagnosis").cumcount() + 1
-    return temp[["Diagnosis", "Visit_Date", "days_since_last", "episode_no"]]
+def build_recurrence(data_merged):
+    """
+    جدول التكرار لكل المرضى في pass واحد:
+    زيارات New Case (مرة لكل Visit_ID) مترتبة بـ (Patient_ID, Diagnosis, Visit_Date)
+    + shift/cumcount على مستوى (مريض، تشخيص).
+    يرجّع {"table", "slices": {patient_id: (start, end)}} للـ lookup.
+    """
+    cols = ["Visit_ID", "Patient_ID", "Diagnosis", "Visit_Date"]
+    temp = data_merged.loc[
+        data_merged["Visit_Type"] == "New Case",
+        [c for c in cols if c in data_merged.columns],
+    ]
+    if "Visit_ID" in temp.columns:
+        temp = temp.drop_duplicates("Visit_ID")
+    temp = temp.dropna(subset=["Patient_ID"]).sort_values(
+        ["Patient_ID", "Diagnosis", "Visit_Date"], kind="mergesort"
+    )
 
+    g = temp.groupby(["Patient_ID", "Diagnosis"], sort=False)["Visit_Date"]
+    temp = temp.assign(
+        days_since_last=(temp["Visit_Date"] - g.shift(1)).dt.days,
+        episode_no=g.cumcount() + 1,
+    ).reset_index(drop=True)
 
-def recurrence_summary(patient_id, data_merged):
-    t = recurrence_table(patient_id, data_merged)
+    pids, starts, counts = np.unique(
+        temp["Patient_ID"].to_numpy(), return_index=True, return_counts=True
+    )
+    slices = {pid: (int(s), int(s + c)) for pid, s, c in zip(pids.tolist(), starts, counts)}
+    return {"table": temp, "slices": slices}
+
+
+def recurrence_table(patient_id, data_merged=None, recurrence=None):
+    if recurrence is None:
+        recurrence = build_recurrence(data_merged)
+    span = recurrence["slices"].get(patient_id)
+    if span is None:
+        return pd.DataFrame(columns=_REC_COLS)
+    return recurrence["table"].iloc[span[0]:span[1]][_REC_COLS]
+
+
+def recurrence_summary(patient_id, data_merged=None, recurrence=None):
+    t = recurrence_table(patient_id, data_merged, recurrence)
     if t.empty:
         return pd.DataFrame(
             columns=[
@@ -196,3 +435,314 @@ def recurrence_summary(patient_id, data_merged):
     )
     s["avg_days_between"] = s["avg_days_between"].round(1)
     return s
+
+
+def recurrence_by_diagnosis(recurrence):
+    """
+    على مستوى العيادة: أي تشخيص بيتكرر أسرع (من الجدول المحسوب مسبقًا).
+    """
+    t = recurrence["table"].dropna(subset=["days_since_last"])
+    if t.empty:
+        return pd.DataFrame(
+            columns=[
+                "Diagnosis", "recurrences", "patients_with_recurrence",
+                "median_days_between", "avg_days_between",
+            ]
+        )
+    out = (
+        t.groupby("Diagnosis")
+        .agg(
+            recurrences=("days_since_last", "count"),
+            patients_with_recurrence=("Patient_ID", "nunique"),
+            median_days_between=("days_since_last", "median"),
+            avg_days_between=("days_since_last", "mean"),
+        )
+        .reset_index()
+        .sort_values(["median_days_between", "recurrences"], ascending=[True, False])
+    )
+    out["avg_days_between"] = out["avg_days_between"].round(1)
+    return out
+
+
+# =========================================================
+# عدّادات (Diagnosis, Drug_Name) بتتحدث مع كل حفظ – O(السطور الجديدة)
+# =========================================================
+_DIAG_DRUG_KEYS = ["Diagnosis", "Drug_Name"]
+
+
+def _add_partials(counters, p):
+    for row in p.itertuples(index=False):
+        key = (row.Diagnosis, row.Drug_Name)
+        c = counters.get(key)
+        vals = [row.rows, row.total_cases, row.cured_cases, row.rec_sum, row.rec_n]
+        if c is None:
+            counters[key] = [float(v) for v in vals]
+        else:
+            for i, v in enumerate(vals):
+                c[i] += v
+    return counters
+
+
+def build_drug_diag_counters(data_merged):
+    """
+    {(diagnosis, drug): [rows, total_cases, cured_cases, rec_sum, rec_n]}
+    """
+    return _add_partials({}, _partials(_analytics_base(data_merged), _DIAG_DRUG_KEYS))
+
+
+def update_drug_diag_counters(counters, new_rows):
+    """بيجمع السطور الجديدة بس ويضيفها على العدّادات."""
+    if new_rows is None or new_rows.empty:
+        return counters
+    return _add_partials(counters, _partials(_analytics_base(new_rows), _DIAG_DRUG_KEYS))
+
+
+def counters_frame(counters):
+    """العدّادات كـ DataFrame بنفس شكل المجاميع الجزئية (منها A-1 و A-3)."""
+    if not counters:
+        return pd.DataFrame(columns=_DIAG_DRUG_KEYS + _PARTIAL_COLS)
+    keys = list(counters.keys())
+    out = pd.DataFrame(list(counters.values()), columns=_PARTIAL_COLS)
+    out.insert(0, "Drug_Name", [k[1] for k in keys])
+    out.insert(0, "Diagnosis", [k[0] for k in keys])
+    return out
+
+
+# =========================================================
+# قوالب العلاج لكل تشخيص (صفحة AI) – بتتحدث مع كل حفظ
+# =========================================================
+_TEMPLATE_MEANS = ["Dose_Value", "Freq_Value", "Duration_Days"]
+_TEMPLATE_MODES = ["Dose_Unit", "Freq_Unit", "Route"]
+_TEMPLATE_COLS = [
+    "Drug_Name", "n", "avg_dose", "most_dose_unit",
+    "avg_freq", "most_freq_unit", "avg_duration", "most_route",
+]
+
+
+def _add_template_rows(templates, rows):
+    df = rows.reindex(columns=_DIAG_DRUG_KEYS + _TEMPLATE_MEANS + _TEMPLATE_MODES)
+    df = df.dropna(subset=_DIAG_DRUG_KEYS)
+    if df.empty:
+        return templates
+    df["Diagnosis"] = df["Diagnosis"].astype(str).str.strip()
+    df[_TEMPLATE_MEANS] = df[_TEMPLATE_MEANS].apply(pd.to_numeric, errors="coerce")
+
+    # مجموع + عدد القيم الموجودة (المتوسط = sum / count زي mean بيتجاهل NaN)
+    g = df.groupby(_DIAG_DRUG_KEYS)
+    sizes = g.size()
+    sums = g[_TEMPLATE_MEANS].sum().to_numpy()
+    counts = g[_TEMPLATE_MEANS].count().to_numpy()
+    for (diag, drug), n, s, c in zip(sizes.index, sizes.to_numpy(), sums, counts):
+        by_drug = templates.setdefault(diag, {})
+        entry = by_drug.get(drug)
+        if entry is None:
+            entry = by_drug[drug] = {
+                "n": 0,
+                "sum": [0.0] * len(_TEMPLATE_MEANS),
+                "count": [0] * len(_TEMPLATE_MEANS),
+                **{col: Counter() for col in _TEMPLATE_MODES},
+            }
+        entry["n"] += int(n)
+        for i in range(len(_TEMPLATE_MEANS)):
+            entry["sum"][i] += float(s[i])
+            entry["count"][i] += int(c[i])
+
+    # القيمة الأكثر تكرارًا = Counter لكل عمود (المجموعة اللي كلها NaN بتفضل فاضية)؛
+    # القيم بتدخل بترتيب أول ظهور (sort=False) → التعادل لأول قيمة ظهرت زي value_counts
+    for col in _TEMPLATE_MODES:
+        vc = df.dropna(subset=[col]).groupby(_DIAG_DRUG_KEYS + [col], sort=False).size()
+        for (diag, drug, val), n in zip(vc.index, vc.to_numpy()):
+            templates[diag][drug][col][val] += int(n)
+    return templates
+
+
+def build_regimen_templates(data_merged):
+    """
+    {diagnosis: {drug: {"n", "sum", "count", Dose_Unit/Freq_Unit/Route: Counter}}}
+    """
+    return _add_template_rows({}, data_merged)
+
+
+def update_regimen_templates(templates, new_rows):
+    """بيضيف سطور الزيارة الجديدة بس."""
+    if new_rows is None or new_rows.empty:
+        return templates
+    return _add_template_rows(templates, new_rows)
+
+
+def regimen_template(templates, diagnosis, top_k=None):
+    """
+    أكثر الأدوية استخدامًا مع التشخيص + متوسط الجرعة/التكرار/المدة
+    والوحدة/طريقة الإعطاء الأكثر تكرارًا.
+    """
+    by_drug = templates.get(str(diagnosis).strip(), {})
+    items = by_drug.items()
+    if top_k:
+        items = heapq.nlargest(top_k, items, key=lambda kv: kv[1]["n"])
+    rows = []
+    for drug, e in items:
+        means = [s / c if c else np.nan for s, c in zip(e["sum"], e["count"])]
+        modes = [e[col].most_common(1)[0][0] if e[col] else None for col in _TEMPLATE_MODES]
+        rows.append([drug, e["n"], means[0], modes[0], means[1], modes[1], means[2], modes[2]])
+    out = pd.DataFrame(rows, columns=_TEMPLATE_COLS)
+    return out.sort_values("n", ascending=False, kind="mergesort").reset_index(drop=True)
+
+
+# =========================================================
+# Cohorts: A-1/A-2/A-3 مقسّمة بشرائح العمر والوزن
+# =========================================================
+COHORT_KEYS = ["Age_Band", "Weight_Band"]
+
+
+def build_cohort_partials(data_merged):
+    """
+    مجاميع جزئية على مستوى (شريحة عمر، شريحة وزن، ...) – مرة واحدة لكل نسخة داتا.
+    أي فلترة بعد كده = filter + sum على جدول صغير.
+    """
+    df = _analytics_base(data_merged, extra_cols=COHORT_KEYS)
+    df[COHORT_KEYS] = df[COHORT_KEYS].fillna("Unknown")
+    return {
+        "drug": _partials(df, COHORT_KEYS + _DIAG_DRUG_KEYS),
+        "complaint": _partials(df, COHORT_KEYS + ["Diagnosis", "Chief_Complaint"]),
+    }
+
+
+def cohort_slice(cohort_partials, level="a1", age_bands=None, weight_bands=None):
+    """
+    level: a1 (تشخيص × دواء) / a2 (تشخيص × شكوى) / a3 (دواء)
+    """
+    p = cohort_partials["complaint" if level == "a2" else "drug"]
+    mask = pd.Series(True, index=p.index)
+    if age_bands:
+        mask &= p["Age_Band"].isin(age_bands)
+    if weight_bands:
+        mask &= p["Weight_Band"].isin(weight_bands)
+    p = p[mask]
+
+    keys = {
+        "a1": _DIAG_DRUG_KEYS,
+        "a2": ["Diagnosis", "Chief_Complaint"],
+        "a3": ["Drug_Name"],
+    }[level]
+    p = p.groupby(keys, as_index=False)[_PARTIAL_COLS].sum()
+    return {"a1": _finish_a1, "a2": _finish_a2, "a3": _finish_a3}[level](p)
+
+
+# =========================================================
+# فريمات الـ Engine: lock + سطور متأجلة (concat واحد عند القراءة)
+# =========================================================
+def engine_lock(engine):
+    """RLock واحد لكل Engine (الـ Engine متشارك بين الـ sessions عن طريق cache_resource)."""
+    lock = engine.get("lock")
+    if lock is None:
+        lock = engine.setdefault("lock", threading.RLock())
+    return lock
+
+
+def engine_append(engine, name, rows):
+    """سطور جديدة لفريم في الـ Engine – بتتحط في buffer (من غير نسخ الفريم كله)."""
+    if rows is not None and not rows.empty:
+        with engine_lock(engine):
+            engine.setdefault("pending", {}).setdefault(name, []).append(rows)
+
+
+def engine_frame(engine, name):
+    """
+    الفريم كامل: أي سطور متأجلة بتتدمج في concat واحد (مهما كان عدد مرات الحفظ)
+    وأول قراءة بعد الحفظ بس هي اللي بتدفع تمنه.
+    """
+    if engine.get("pending", {}).get(name):
+        with engine_lock(engine):
+            parts = engine["pending"].pop(name, None)
+            if parts:
+                engine[name] = pd.concat([engine[name]] + parts, ignore_index=True)
+    return engine[name]
+
+
+# =========================================================
+# Memo للتحليلات على الـ Engine (حسب نسخة الداتا + lazy)
+# =========================================================
+# كل جدول بيعتمد على أي شيتات – الحفظ بيبطّل الجداول المتأثرة بس
+ANALYTICS_DEPS = {
+    "p1": ("visits", "visit_drugs"),
+    "a1": ("visits", "visit_drugs"),
+    "a2": ("visits", "visit_drugs"),
+    "a3": ("visits", "visit_drugs"),
+    "dose_outliers": ("visits", "visit_drugs"),
+    "dose_stats": ("visits", "visit_drugs"),
+    "dose_suggestions": ("visits", "visit_drugs"),
+    "recurrence": ("visits",),
+    "recurrence_by_diagnosis": ("visits",),
+    "cohort_partials": ("visits", "visit_drugs"),
+    "growth": ("visits", "patients"),
+    "data_quality": ("patients", "visits", "visit_drugs"),
+    "drug_name_suggestions": ("visit_drugs", "ref"),
+    "query_index": ("visits", "visit_drugs"),
+    "ref_lists": ("ref",),
+}
+
+# الـ memo بيحتفظ بالسطور اللي |z| فيها أكبر من الحد ده، والصفحة بتفلتر فوقه
+OUTLIER_MEMO_Z = 2.0
+
+
+def _compute_analytics(engine, name):
+    if name == "p1":
+        # من العدّادات لو موجودة (O(عدد المجموعات)) بدل regroup للتاريخ كله
+        if "drug_diag_counters" in engine:
+            return counters_frame(engine["drug_diag_counters"])
+        p = get_analytics(engine, "cohort_partials")["drug"]
+        return p.groupby(_DIAG_DRUG_KEYS, as_index=False)[_PARTIAL_COLS].sum()
+    if name == "a1":
+        return _finish_a1(get_analytics(engine, "p1"))
+    if name == "a3":
+        p1 = get_analytics(engine, "p1")
+        return _finish_a3(p1.groupby("Drug_Name", as_index=False)[_PARTIAL_COLS].sum())
+    if name == "a2":
+        # من نفس المجاميع الجزئية بتاعة الـ cohorts (نسخة واحدة + pass واحد للـ A-1/A-2/A-3)
+        return cohort_slice(get_analytics(engine, "cohort_partials"), "a2")
+    if name == "dose_outliers":
+        return dose_outliers(engine_frame(engine, "data_merged"), z=OUTLIER_MEMO_Z)
+    if name == "dose_stats":
+        return dose_ranges(engine_frame(engine, "data_merged"))
+    if name == "dose_suggestions":
+        return dose_suggestion_table(engine_frame(engine, "data_merged"))
+    if name == "recurrence":
+        return build_recurrence(engine_frame(engine, "data_merged"))
+    if name == "growth":
+        return growth_zscores(
+            engine_frame(engine, "visits"), engine_frame(engine, "patients"), engine.get("growth_tables", {})
+        )
+    if name == "cohort_partials":
+        return build_cohort_partials(engine_frame(engine, "data_merged"))
+    if name == "recurrence_by_diagnosis":
+        return recurrence_by_diagnosis(get_analytics(engine, "recurrence"))
+    if name == "ref_lists":
+        return build_reference_lists(engine["ref"])
+    if name == "query_index":
+        return build_query_index(engine_frame(engine, "data_merged"))
+    if name == "data_quality":
+        # بيقرا الملف على دفعات – مش من الـ DataFrames اللي في الذاكرة
+        return profile_workbook(engine["file_path"])
+    if name == "drug_name_suggestions":
+        return unmatched_drug_names(engine_frame(engine, "visit_drugs"), engine["drug_canon"])
+    raise KeyError(f"Unknown analytics table: {name}")
+
+
+def _deps_version(engine, name):
+    versions = engine.get("versions", {})
+    return tuple(versions.get(d, 0) for d in ANALYTICS_DEPS[name])
+
+
+def get_analytics(engine, name):
+    """
+    يرجّع الجدول من الـ cache لو نسخة الشيتات اللي بيعتمد عليها متغيرتش،
+    وإلا يحسبه (أول مرة يتطلب فيها بس).
+    """
+    cache = engine.setdefault("analytics_cache", {})
+    version = _deps_version(engine, name)
+    hit = cache.get(name)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    out = _compute_analytics(engine, name)
+    cache[name] = (version, out)
+    return out
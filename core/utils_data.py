@@ -1,8 +1,11 @@
 # core/utils_data.py
 
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+from .utils_drugs import build_drug_canon_index, apply_drug_canon
+
 
 # ================== قراءة البيانات من Excel ==================
 def load_data(file_path: str):
@@ -15,11 +18,53 @@ def load_data(file_path: str):
     visit_drugs = pd.read_excel(file_path, sheet_name="Visit_Drugs")
     ref = pd.read_excel(file_path, sheet_name="Reference_Data")
 
-    merged = visits.merge(visit_drugs, on="Visit_ID", how="left")
+    # توحيد أسماء الأدوية مرة واحدة عند التحميل (Drug_Name_Raw = الاسم الأصلي)
+    visit_drugs = apply_drug_canon(visit_drugs, build_drug_canon_index(ref))
+
+    merged = add_cohort_bins(visits.merge(visit_drugs, on="Visit_ID", how="left"))
     return patients, visits, visit_drugs, ref, merged
 
 
 # ================== قراءة ليستات الـ Reference_Data ==================
+# اسم الليستة → عمود شيت Reference_Data (بنفس ترتيب load_reference_lists)
+REF_LIST_COLS = {
+    "diagnoses": "Diagnosis_List",
+    "complaints": "Chief_Complaints",
+    "drugs": "Drug_List",
+    "dose_units": "Dose_Units",
+    "freq_units": "Freq_Units",
+    "visit_types": "Visit_Types",
+    "outcomes": "Outcome_Classes",
+    "routes": "Routes",
+}
+
+
+def _ref_col_values(ref: pd.DataFrame, col_name: str) -> tuple:
+    if ref is None or col_name not in ref.columns:
+        return ()
+    return tuple(
+        ref[col_name]
+        .dropna()
+        .astype(str)
+        .str.strip()
+        .replace("", pd.NA)
+        .dropna()
+        .unique()
+        .tolist()
+    )
+
+
+def build_reference_lists(ref: pd.DataFrame) -> dict:
+    """
+    ليستات الـ Reference_Data من الشيت اللي اتقرا خلاص:
+    {"values": {name: tuple}, "index": {name: {value: position}}}
+    الـ index = موضع كل قيمة في الـ tuple (lookup O(1) لاختيار قيمة الـ selectbox).
+    """
+    values = {name: _ref_col_values(ref, col) for name, col in REF_LIST_COLS.items()}
+    index = {name: {v: i for i, v in enumerate(vals)} for name, vals in values.items()}
+    return {"values": values, "index": index}
+
+
 def load_reference_lists(file_path: str):
     """
     يقرأ شيت Reference_Data ويستخرج:
@@ -27,40 +72,8 @@ def load_reference_lists(file_path: str):
     visit_types, outcome_classes, routes
     """
     ref = pd.read_excel(file_path, sheet_name="Reference_Data")
-
-    def col_list(col_name):
-        if col_name not in ref.columns:
-            return []
-        return (
-            ref[col_name]
-            .dropna()
-            .astype(str)
-            .str.strip()
-            .replace("", pd.NA)
-            .dropna()
-            .unique()
-            .tolist()
-        )
-
-    diag_list = col_list("Diagnosis_List")
-    cc_list = col_list("Chief_Complaints")
-    drug_list = col_list("Drug_List")
-    dose_units = col_list("Dose_Units")
-    freq_units = col_list("Freq_Units")
-    visit_types = col_list("Visit_Types")
-    outcome_classes = col_list("Outcome_Classes")
-    routes = col_list("Routes")
-
-    return (
-        diag_list,
-        cc_list,
-        drug_list,
-        dose_units,
-        freq_units,
-        visit_types,
-        outcome_classes,
-        routes,
-    )
+    values = build_reference_lists(ref)["values"]
+    return tuple(list(values[name]) for name in REF_LIST_COLS)
 
 
 # ================== أدوات مساعدة عامة ==================
@@ -151,3 +164,90 @@ def df_base_clean(df: pd.DataFrame) -> pd.DataFrame:
         df["Drug_Name"] = df["Drug_Name"].fillna("Unknown")
 
     return df.reset_index(drop=True)
+
+
+# ================== شرائح الوزن (Weight Bands) ==================
+WEIGHT_BAND_EDGES = [5, 10, 15, 20, 30, 40]
+WEIGHT_BAND_LABELS = ["<5kg", "5-10kg", "10-15kg", "15-20kg", "20-30kg", "30-40kg", "40kg+"]
+
+
+def weight_band_codes(weights) -> np.ndarray:
+    """
+    كود الشريحة لكل وزن (np.digitize) – الوزن الناقص أو <= 0 بياخد -1.
+    """
+    w = pd.to_numeric(pd.Series(weights), errors="coerce").to_numpy(dtype=float)
+    codes = np.digitize(w, WEIGHT_BAND_EDGES)
+    return np.where(np.isnan(w) | (w <= 0), -1, codes)
+
+
+# ================== شرائح العمر + أعمدة الـ Cohort ==================
+AGE_BAND_EDGES = [6, 24, 60, 144]  # بالشهور
+AGE_BAND_LABELS = ["0-6m", "6-24m", "2-5y", "5-12y", "12y+"]
+
+
+def age_band_codes(ages_months) -> np.ndarray:
+    a = pd.to_numeric(pd.Series(ages_months), errors="coerce").to_numpy(dtype=float)
+    codes = np.digitize(a, AGE_BAND_EDGES)
+    return np.where(np.isnan(a) | (a < 0), -1, codes)
+
+
+def _band_labels(codes, labels) -> np.ndarray:
+    lookup = np.array(labels + ["Unknown"], dtype=object)  # -1 → آخر عنصر
+    return lookup[codes]
+
+
+def add_cohort_bins(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    يضيف Age_Band و Weight_Band (np.digitize مرة واحدة عند التحميل).
+    """
+    if df is None or df.empty:
+        return df
+    df = df.copy()
+    if "Age_Months" in df.columns:
+        df["Age_Band"] = _band_labels(age_band_codes(df["Age_Months"].to_numpy()), AGE_BAND_LABELS)
+    if "Weight_KG" in df.columns:
+        df["Weight_Band"] = _band_labels(weight_band_codes(df["Weight_KG"].to_numpy()), WEIGHT_BAND_LABELS)
+    return df
+
+
+# ================== Timeline لكل مريض (زيارات + أدوية مرتبة بالتاريخ) ==================
+_TIMELINE_SORT = ["Patient_ID", "Visit_Date", "Visit_ID", "Line_No"]
+
+
+def build_patient_timeline(data_merged: pd.DataFrame) -> dict:
+    """
+    الـ merged (زيارة + سطور أدويتها) مترتب مرة واحدة بـ (Patient_ID, Visit_Date, Line_No).
+    يرجّع {"table", "slices": {patient_id: (start, end)}, "extra": {patient_id: [DataFrame]}}
+    – extra = الزيارات اللي اتضافت بعد البناء.
+    """
+    keys = [c for c in _TIMELINE_SORT if c in data_merged.columns]
+    table = (
+        data_merged.dropna(subset=["Patient_ID"])
+        .sort_values(keys, kind="mergesort")
+        .reset_index(drop=True)
+    )
+    pids, starts, counts = np.unique(
+        table["Patient_ID"].to_numpy(), return_index=True, return_counts=True
+    )
+    slices = {pid: (int(s), int(s + c)) for pid, s, c in zip(pids.tolist(), starts, counts)}
+    return {"table": table, "slices": slices, "extra": {}}
+
+
+def timeline_add_visit(timeline: dict, new_merged: pd.DataFrame) -> dict:
+    """زيارة جديدة (بسطورها) بتتحط في extra للمريض – من غير إعادة ترتيب الجدول."""
+    for pid, rows in new_merged.dropna(subset=["Patient_ID"]).groupby("Patient_ID"):
+        timeline["extra"].setdefault(pid, []).append(rows)
+    return timeline
+
+
+def patient_timeline(timeline: dict, patient_id) -> pd.DataFrame:
+    """كل زيارات المريض بسطور أدويتها مرتبة – lookup مش scan."""
+    table = timeline["table"]
+    span = timeline["slices"].get(patient_id)
+    parts = [table.iloc[span[0]:span[1]]] if span is not None else []
+    extra = timeline["extra"].get(patient_id, [])
+    if not extra:
+        return parts[0] if parts else table.iloc[0:0]
+    out = pd.concat(parts + extra, ignore_index=True)
+    keys = [c for c in _TIMELINE_SORT[1:] if c in out.columns]
+    return out.sort_values(keys, kind="mergesort").reset_index(drop=True)
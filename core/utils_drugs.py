@@ -0,0 +1,611 @@
+# core/utils_drugs.py
+# توحيد أسماء الأدوية (Canonicalization) قبل التحليلات والموديل
+
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .utils_text import normalize_basic, trigrams, dice_similarity, edit_distance
+
+
+# تركيزات زي "250mg" أو "125 mg/5 ml" أو "0.9%" بتتشال قبل المقارنة
+_STRENGTH_RE = re.compile(
+    r"(?<![a-z])\d+(?:[.,]\d+)?\s*(?:mg|mcg|µg|g|ml|iu|units?|%)"
+    r"(?:\s*/\s*\d*(?:[.,]\d+)?\s*(?:ml|l|g|kg|tab|dose))?(?![a-z])",
+    re.IGNORECASE,
+)
+
+# الـ fuzzy بيدمج تلقائي بس لو نفس الكلمات بخطأ إملائي صغير في كل كلمة
+# (Vitamin A ≠ Vitamin D، Levocetirizine ≠ Cetirizine)؛ غير كده اقتراح بس
+FUZZY_MIN_SCORE = 0.75
+FUZZY_MIN_LEN = 4
+TYPO_MIN_TOKEN_LEN = 4
+
+
+def normalize_drug_name(raw) -> str:
+    """
+    lower + إزالة التركيز + إزالة الرموز → مفتاح المقارنة.
+    """
+    if raw is None or (isinstance(raw, float) and pd.isna(raw)):
+        return ""
+    s = _STRENGTH_RE.sub(" ", str(raw).lower())
+    return normalize_basic(s)
+
+
+def _split_aliases(value) -> list:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return []
+    return [a.strip() for a in re.split(r"[;,|]", str(value)) if a.strip()]
+
+
+# =========================================================
+# بناء الـ Index (مرة واحدة + cache)
+# =========================================================
+@lru_cache(maxsize=8)
+def _build_canon_index(names: tuple, aliases: tuple) -> dict:
+    canonical = []
+    id_of = {}
+    exact = {}
+    normalized = {}
+    entries = []  # (normalized key, trigram set, drug_id)
+
+    def _register(key_raw, drug_id):
+        exact.setdefault(key_raw.strip().lower(), drug_id)
+        norm = normalize_drug_name(key_raw)
+        if norm and norm not in normalized:
+            normalized[norm] = drug_id
+            entries.append((norm, trigrams(norm), drug_id))
+
+    for name, alias_str in zip(names, aliases):
+        name = name.strip()
+        if not name:
+            continue
+        drug_id = id_of.get(name)
+        if drug_id is None:
+            drug_id = len(canonical)
+            canonical.append(name)
+            id_of[name] = drug_id
+        _register(name, drug_id)
+        for alias in _split_aliases(alias_str):
+            _register(alias, drug_id)
+
+    postings = defaultdict(list)
+    for entry_no, (_, grams, _) in enumerate(entries):
+        for g in grams:
+            postings[g].append(entry_no)
+
+    return {
+        "canonical": canonical,
+        "id_of": id_of,
+        "exact": exact,
+        "normalized": normalized,
+        "entries": entries,
+        "postings": dict(postings),
+    }
+
+
+def build_drug_canon_index(ref: pd.DataFrame) -> dict:
+    """
+    يبني index من Reference_Data:
+    - Drug_List: الأسماء الرسمية (canonical) و الـ ID = ترتيبها في الليست
+    - Drug_Aliases (اختياري): أسماء تجارية/بديلة لنفس السطر مفصولة بـ ; أو ,
+    """
+    if ref is None or "Drug_List" not in ref.columns:
+        return _build_canon_index((), ())
+
+    drugs = ref["Drug_List"]
+    mask = drugs.notna()
+    names = tuple(drugs[mask].astype(str))
+    if "Drug_Aliases" in ref.columns:
+        aliases = tuple(ref.loc[mask, "Drug_Aliases"].fillna("").astype(str))
+    else:
+        aliases = ("",) * len(names)
+    return _build_canon_index(names, aliases)
+
+
+# =========================================================
+# Lookup: exact → normalized → typo (نفس الكلمات) ؛ الباقي اقتراحات
+# =========================================================
+def _is_typo_of(norm: str, entry_norm: str) -> bool:
+    """
+    نفس الكلمات بنفس الترتيب (أو نفس الـ set) وكل كلمة فرقها خطأ إملائي صغير:
+    الكلمات القصيرة (< 4 حروف) لازم تتطابق بالظبط، و≤ 1 تعديل للكلمة (≤ 2 لو 8 حروف أو أكتر).
+    """
+    a, b = norm.split(), entry_norm.split()
+    if sorted(a) == sorted(b):
+        return True
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if x == y:
+            continue
+        if min(len(x), len(y)) < TYPO_MIN_TOKEN_LEN:
+            return False
+        budget = 2 if min(len(x), len(y)) >= 8 else 1
+        if edit_distance(x, y, budget) > budget:
+            return False
+    return True
+
+
+def _fuzzy_candidates(index: dict, norm: str, min_score: float):
+    """(score, entry_no) مرتبة من الأعلى – Dice على الـ trigrams."""
+    grams = trigrams(norm)
+    hits = set()
+    for g in grams:
+        hits.update(index["postings"].get(g, ()))
+    scored = []
+    for entry_no in hits:
+        score = dice_similarity(grams, index["entries"][entry_no][1])
+        if score >= min_score:
+            scored.append((score, entry_no))
+    scored.sort(key=lambda t: (-t[0], t[1]))
+    return scored
+
+
+def canonicalize_drug_name(index: dict, raw, min_score: float = FUZZY_MIN_SCORE):
+    """
+    يرجّع (drug_id, canonical_name) أو (None, None) لو مفيش تطابق.
+    الـ fuzzy بيتقبل بس لو _is_typo_of (خطأ إملائي)، غير كده شوف suggest_drug_names.
+    """
+    if raw is None or (isinstance(raw, float) and pd.isna(raw)):
+        return None, None
+
+    key = str(raw).strip().lower()
+    drug_id = index["exact"].get(key)
+    if drug_id is not None:
+        return drug_id, index["canonical"][drug_id]
+
+    norm = normalize_drug_name(raw)
+    if not norm:
+        return None, None
+    drug_id = index["normalized"].get(norm)
+    if drug_id is not None:
+        return drug_id, index["canonical"][drug_id]
+
+    if len(norm) < FUZZY_MIN_LEN or not index["entries"]:
+        return None, None
+
+    for _, entry_no in _fuzzy_candidates(index, norm, min_score):
+        entry_norm, _, entry_id = index["entries"][entry_no]
+        if _is_typo_of(norm, entry_norm):
+            return entry_id, index["canonical"][entry_id]
+    return None, None
+
+
+def suggest_drug_names(index: dict, raw, limit: int = 3, min_score: float = 0.5) -> list:
+    """
+    أقرب أسماء رسمية لاسم مش متوحّد (للمراجعة بس – مش بيتدمج تلقائي):
+    list من (canonical_name, score).
+    """
+    norm = normalize_drug_name(raw)
+    if not norm or not index["entries"]:
+        return []
+    out, seen = [], set()
+    for score, entry_no in _fuzzy_candidates(index, norm, min_score):
+        name = index["canonical"][index["entries"][entry_no][2]]
+        if name not in seen:
+            seen.add(name)
+            out.append((name, round(score, 3)))
+        if len(out) >= limit:
+            break
+    return out
+
+
+def canonicalize_drug_series(series: pd.Series, index: dict) -> pd.Series:
+    """
+    يطبّق التوحيد على القيم الفريدة فقط ثم map على العمود كله.
+    الأسماء غير الموجودة في Reference_Data بتتجمع بالـ normalized key
+    (أول كتابة ظهرت هي اللي بتتعرض).
+    """
+    mapping = {}
+    unknown_by_norm = {}
+    for raw in series.dropna().unique():
+        _, canon = canonicalize_drug_name(index, raw)
+        if canon is None:
+            norm = normalize_drug_name(raw)
+            canon = unknown_by_norm.setdefault(norm, str(raw).strip()) if norm else str(raw).strip()
+        mapping[raw] = canon
+    return series.map(mapping)
+
+
+def unmatched_drug_names(df: pd.DataFrame, index: dict, col: str = "Drug_Name_Raw") -> pd.DataFrame:
+    """
+    أسماء أدوية مش موجودة في Reference_Data (ولا خطأ إملائي منها)
+    + عدد السطور + أقرب اسم رسمي كاقتراح.
+    """
+    cols = ["Drug_Name", "lines", "suggestion", "score"]
+    if df is None or col not in df.columns or not index["canonical"]:
+        return pd.DataFrame(columns=cols)
+    rows = []
+    for raw, n in df[col].dropna().value_counts().items():
+        if canonicalize_drug_name(index, raw)[0] is not None:
+            continue
+        sug = suggest_drug_names(index, raw, limit=1)
+        rows.append({
+            "Drug_Name": str(raw).strip(),
+            "lines": int(n),
+            "suggestion": sug[0][0] if sug else "",
+            "score": sug[0][1] if sug else None,
+        })
+    return pd.DataFrame(rows, columns=cols)
+
+
+def apply_drug_canon(df: pd.DataFrame, index: dict, col: str = "Drug_Name") -> pd.DataFrame:
+    """
+    يستبدل Drug_Name بالاسم الموحّد ويحتفظ بالأصلي في Drug_Name_Raw.
+    """
+    if df is None or col not in df.columns:
+        return df
+    df = df.copy()
+    df[f"{col}_Raw"] = df[col]
+    df[col] = canonicalize_drug_series(df[col], index)
+    return df
+
+
+# =========================================================
+# Allergen Index: allergen token → أدوية (class + ingredients)
+# =========================================================
+# مادة فعالة → مجموعات دوائية (للأدوية اللي مش متسجل لها Drug_Class في الشيت)
+_INGREDIENT_CLASSES = {
+    "amoxicillin": ("penicillin", "beta lactam"),
+    "ampicillin": ("penicillin", "beta lactam"),
+    "penicillin": ("penicillin", "beta lactam"),
+    "flucloxacillin": ("penicillin", "beta lactam"),
+    "clavulanate": ("penicillin", "beta lactam"),
+    "augmentin": ("penicillin", "beta lactam"),
+    "cefixime": ("cephalosporin", "beta lactam"),
+    "ceftriaxone": ("cephalosporin", "beta lactam"),
+    "cefuroxime": ("cephalosporin", "beta lactam"),
+    "cephalexin": ("cephalosporin", "beta lactam"),
+    "cefadroxil": ("cephalosporin", "beta lactam"),
+    "azithromycin": ("macrolide",),
+    "clarithromycin": ("macrolide",),
+    "erythromycin": ("macrolide",),
+    "sulfamethoxazole": ("sulfonamide",),
+    "cotrimoxazole": ("sulfonamide",),
+    "ibuprofen": ("nsaid",),
+    "diclofenac": ("nsaid",),
+    "aspirin": ("nsaid", "salicylate"),
+    "paracetamol": ("acetaminophen",),
+    "acetaminophen": ("paracetamol",),
+    "cetirizine": ("antihistamine",),
+    "loratadine": ("antihistamine",),
+    "salbutamol": ("beta agonist",),
+}
+
+# كتابات مختلفة لنفس الحساسية
+_ALLERGEN_SYNONYMS = {
+    "sulfa": "sulfonamide",
+    "sulpha": "sulfonamide",
+    "sulfonamides": "sulfonamide",
+    "penicillins": "penicillin",
+    "cephalosporins": "cephalosporin",
+    "macrolides": "macrolide",
+    "nsaids": "nsaid",
+    "betalactam": "beta lactam",
+    "acetaminophen": "paracetamol",
+    "بنسلين": "penicillin",
+    "البنسلين": "penicillin",
+    "سلفا": "sulfonamide",
+}
+
+# كلمات شكل دوائي/حشو مش بتعتبر مادة فعالة
+_NON_INGREDIENT_WORDS = {
+    "syrup", "suspension", "drops", "drop", "injection", "tablet", "tablets",
+    "capsule", "capsules", "cream", "ointment", "spray", "nasal", "nebulizer",
+    "solution", "saline", "vial", "ampoule", "sachet", "oral", "vitamin",
+    "allergy", "allergic", "to", "and", "or", "with", "of", "none", "no",
+}
+
+_ALLERGY_SPLIT_RE = re.compile(r"[,;/\n+&]|\band\b|\s+و\s*", re.IGNORECASE)
+
+
+def _canon_allergen(token: str) -> str:
+    return _ALLERGEN_SYNONYMS.get(token, token)
+
+
+def _name_phrases(name: str) -> set:
+    """
+    الاسم كامل + كل العبارات المتتالية منه ("Vitamin D Drops" → vitamin, vitamin d, d drops, ...)
+    بالتركيز وبدونه – علشان أي دوا ياخد tokens حتى لو كل كلماته شكل دوائي.
+    """
+    out = set()
+    for norm in {normalize_basic(name), normalize_drug_name(name)}:
+        words = norm.split()
+        for i in range(len(words)):
+            for j in range(i + 1, len(words) + 1):
+                out.add(" ".join(words[i:j]))
+    return out
+
+
+@lru_cache(maxsize=8)
+def _build_allergen_index(names: tuple, classes: tuple, ingredients: tuple) -> dict:
+    tokens = defaultdict(set)
+    for name, cls_str, ingr_str in zip(names, classes, ingredients):
+        ingr = [normalize_basic(x) for x in _split_aliases(ingr_str)]
+        if not ingr:
+            ingr = [
+                w for w in normalize_drug_name(name).split()
+                if w not in _NON_INGREDIENT_WORDS and len(w) > 2
+            ]
+        drug_classes = {normalize_basic(x) for x in _split_aliases(cls_str)}
+        for ing in ingr:
+            drug_classes.update(_INGREDIENT_CLASSES.get(ing, ()))
+
+        for tok in sorted(_name_phrases(name)) + list(ingr) + sorted(drug_classes):
+            if tok:
+                tokens[_canon_allergen(tok)].add(name)
+
+    return {"tokens": {k: frozenset(v) for k, v in tokens.items()}, "names": names}
+
+
+def build_allergen_index(ref: pd.DataFrame, extra_drugs=()) -> dict:
+    """
+    يبني allergen index من Reference_Data:
+    - Drug_List + Drug_Class و Drug_Ingredients (اختياري، مفصولة بـ ;)
+    - extra_drugs: أسماء أدوية إضافية (مثلاً classes الموديل) بدون بيانات class
+    """
+    names, classes, ingredients = [], [], []
+    if ref is not None and "Drug_List" in ref.columns:
+        mask = ref["Drug_List"].notna()
+        names = ref.loc[mask, "Drug_List"].astype(str).str.strip().tolist()
+        for col, target in (("Drug_Class", classes), ("Drug_Ingredients", ingredients)):
+            if col in ref.columns:
+                target.extend(ref.loc[mask, col].fillna("").astype(str).tolist())
+            else:
+                target.extend([""] * len(names))
+
+    known = set(names)
+    for d in extra_drugs:
+        if isinstance(d, str) and d.strip() and d.strip() not in known:
+            known.add(d.strip())
+            names.append(d.strip())
+            classes.append("")
+            ingredients.append("")
+
+    return _build_allergen_index(tuple(names), tuple(classes), tuple(ingredients))
+
+
+def tokenize_allergies(allergies_text) -> set:
+    """
+    "Penicillin, sulfa" → {"penicillin", "sulfonamide"}
+    كل جزء بيتاخد كعبارة كاملة + كلماته المنفردة.
+    """
+    if allergies_text is None or (isinstance(allergies_text, float) and pd.isna(allergies_text)):
+        return set()
+    out = set()
+    for part in _ALLERGY_SPLIT_RE.split(str(allergies_text)):
+        phrase = normalize_basic(part)
+        if not phrase:
+            continue
+        out.add(_canon_allergen(phrase))
+        for w in phrase.split():
+            if w not in _NON_INGREDIENT_WORDS and len(w) > 2:
+                out.add(_canon_allergen(w))
+    return out
+
+
+def _allergy_phrases(allergies_text) -> list:
+    # النص كامل (نفس القاعدة القديمة) + كل جزء متطبّع من 3 حروف أو أكتر
+    phrases = [str(allergies_text).strip().lower()]
+    for part in _ALLERGY_SPLIT_RE.split(str(allergies_text)):
+        phrase = normalize_basic(part)
+        if len(phrase) >= 3:
+            phrases.append(phrase)
+    return [p for p in dict.fromkeys(phrases) if p]
+
+
+def allergy_matches(allergen_index: dict, allergies_text, drug_names=()) -> dict:
+    """
+    يرجّع {drug_name: "allergen1, allergen2"} للأدوية الممنوعة.
+    - lookup في الـ allergen index (مادة فعالة / مجموعة / عبارة من الاسم)
+    - وكمان fallback بالـ substring (القاعدة القديمة) على كل اسم في الـ index
+      + drug_names (أدوية مش في الـ index زي classes موديل قديم) – عدم وجود tokens مش معناه أمان.
+    """
+    if allergies_text is None or (isinstance(allergies_text, float) and pd.isna(allergies_text)):
+        return {}
+    hits = defaultdict(set)
+    idx = allergen_index["tokens"]
+    for tok in tokenize_allergies(allergies_text):
+        for drug in idx.get(tok, ()):
+            hits[drug].add(tok)
+
+    phrases = _allergy_phrases(allergies_text)
+    names = dict.fromkeys(list(allergen_index.get("names", ())) + [d for d in drug_names if isinstance(d, str)])
+    for drug in names:
+        low, norm = drug.lower(), normalize_basic(drug)
+        for phrase in phrases:
+            if phrase in low or phrase in norm:
+                hits[drug].add(phrase)
+    return {drug: ", ".join(sorted(toks)) for drug, toks in hits.items()}
+
+
+# =========================================================
+# Drug–Drug Interactions: sparse symmetric matrix
+# =========================================================
+SEVERITY_LEVELS = {"minor": 1, "moderate": 2, "major": 3}
+SEVERITY_LABELS = {v: k for k, v in SEVERITY_LEVELS.items()}
+
+_INTERACTION_COLS = ["Drug_A", "Drug_B", "Severity", "Note"]
+
+
+def _parse_severity(value) -> int:
+    key = normalize_basic(value)
+    return SEVERITY_LEVELS.get(key, SEVERITY_LEVELS["moderate"])
+
+
+def load_interaction_table(ref: pd.DataFrame = None, file_path=None) -> pd.DataFrame:
+    """
+    يجمع التداخلات من مصدرين (الاتنين اختياريين):
+    - ملف CSV محلي: Drug_A, Drug_B, Severity, Note
+    - عمود Drug_Interactions في Reference_Data بجانب Drug_List:
+      "Drug X:major; Drug Y" (الـ severity الافتراضية moderate)
+    """
+    frames = []
+
+    if file_path is not None:
+        try:
+            tbl = pd.read_csv(file_path)
+            if {"Drug_A", "Drug_B"}.issubset(tbl.columns):
+                frames.append(tbl.reindex(columns=_INTERACTION_COLS))
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            pass
+
+    if ref is not None and {"Drug_List", "Drug_Interactions"}.issubset(ref.columns):
+        rows = []
+        for drug, spec in ref[["Drug_List", "Drug_Interactions"]].dropna().itertuples(index=False):
+            for item in _split_aliases(spec):
+                other, _, sev = item.partition(":")
+                rows.append({"Drug_A": str(drug).strip(), "Drug_B": other.strip(),
+                             "Severity": sev.strip() or "moderate", "Note": ""})
+        if rows:
+            frames.append(pd.DataFrame(rows, columns=_INTERACTION_COLS))
+
+    if not frames:
+        return pd.DataFrame(columns=_INTERACTION_COLS)
+
+    out = pd.concat(frames, ignore_index=True).dropna(subset=["Drug_A", "Drug_B"])
+    out["Note"] = out["Note"].fillna("")
+    return out.reset_index(drop=True)
+
+
+def build_interaction_matrix(table: pd.DataFrame, canon_index: dict = None) -> dict:
+    """
+    يحوّل جدول التداخلات لـ sparse symmetric matrix (drug × drug) قيمها severity.
+    الأسماء بتتوحد بنفس canon index بتاع Drug_Name.
+    """
+    if table is None or table.empty:
+        return {"matrix": sparse.csr_matrix((0, 0), dtype=np.int8), "id_of": {}, "names": [], "notes": {}}
+
+    a = table["Drug_A"].astype(str).str.strip()
+    b = table["Drug_B"].astype(str).str.strip()
+    if canon_index is not None:
+        a = canonicalize_drug_series(a, canon_index)
+        b = canonicalize_drug_series(b, canon_index)
+
+    names = sorted(set(a) | set(b))
+    id_of = {n: i for i, n in enumerate(names)}
+    ia = a.map(id_of).to_numpy()
+    ib = b.map(id_of).to_numpy()
+    sev = table["Severity"].map(_parse_severity).to_numpy()
+
+    keep = ia != ib
+    ia, ib, sev = ia[keep], ib[keep], sev[keep]
+    lo, hi = np.minimum(ia, ib), np.maximum(ia, ib)
+
+    # نفس الزوج مكرر؟ ناخد أعلى severity
+    pairs = pd.DataFrame({"lo": lo, "hi": hi, "sev": sev}).groupby(["lo", "hi"], as_index=False)["sev"].max()
+    rows = np.concatenate([pairs["lo"], pairs["hi"]])
+    cols = np.concatenate([pairs["hi"], pairs["lo"]])
+    data = np.concatenate([pairs["sev"], pairs["sev"]]).astype(np.int8)
+    n = len(names)
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(n, n))
+
+    notes = {}
+    for x, y, note in zip(lo, hi, table.loc[keep, "Note"]):
+        if note:
+            notes.setdefault((int(x), int(y)), str(note))
+
+    return {"matrix": matrix, "id_of": id_of, "names": names, "notes": notes}
+
+
+def regimen_interactions(interactions: dict, drug_names) -> pd.DataFrame:
+    """
+    كل الأزواج الخطرة في روشتة كاملة بـ lookup واحد على الـ sub-matrix.
+    """
+    cols = ["Drug_A", "Drug_B", "Severity", "Note"]
+    if not interactions or not interactions["id_of"]:
+        return pd.DataFrame(columns=cols)
+
+    id_of = interactions["id_of"]
+    ids = []
+    for name in drug_names:
+        drug_id = id_of.get(str(name).strip()) if name else None
+        if drug_id is not None and drug_id not in ids:
+            ids.append(drug_id)
+    if len(ids) < 2:
+        return pd.DataFrame(columns=cols)
+
+    ids = np.asarray(ids)
+    sub = sparse.triu(interactions["matrix"][ids][:, ids], k=1).tocoo()
+    if sub.nnz == 0:
+        return pd.DataFrame(columns=cols)
+
+    names = interactions["names"]
+    rows = []
+    for r, c, sev in zip(sub.row, sub.col, sub.data):
+        x, y = int(ids[r]), int(ids[c])
+        rows.append({
+            "Drug_A": names[x],
+            "Drug_B": names[y],
+            "Severity": SEVERITY_LABELS.get(int(sev), "moderate"),
+            "Note": interactions["notes"].get((min(x, y), max(x, y)), ""),
+        })
+    out = pd.DataFrame(rows, columns=cols)
+    order = out["Severity"].map(SEVERITY_LEVELS)
+    return out.loc[order.sort_values(ascending=False).index].reset_index(drop=True)
+
+
+# =========================================================
+# Drug–Condition Cautions: دوا + تشخيص (مش دوا + دوا)
+# =========================================================
+_CAUTION_COLS = ["Drug", "Diagnosis", "Severity", "Note"]
+
+
+def load_caution_table(file_path=None) -> pd.DataFrame:
+    """ملف CSV محلي (اختياري): Drug, Diagnosis, Severity, Note."""
+    if file_path is not None:
+        try:
+            tbl = pd.read_csv(file_path)
+            if {"Drug", "Diagnosis"}.issubset(tbl.columns):
+                out = tbl.reindex(columns=_CAUTION_COLS).dropna(subset=["Drug", "Diagnosis"])
+                out["Note"] = out["Note"].fillna("")
+                return out.reset_index(drop=True)
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            pass
+    return pd.DataFrame(columns=_CAUTION_COLS)
+
+
+def build_caution_index(table: pd.DataFrame, canon_index: dict = None) -> dict:
+    """
+    {تشخيص متطبّع: {دوا: (severity, note)}} – الأسماء بتتوحد بنفس canon index
+    بتاع Drug_Name، ولو الزوج مكرر ناخد أعلى severity.
+    """
+    index = {}
+    if table is None or table.empty:
+        return index
+    drugs = table["Drug"].astype(str).str.strip()
+    if canon_index is not None:
+        drugs = canonicalize_drug_series(drugs, canon_index)
+    for drug, diag, sev, note in zip(drugs, table["Diagnosis"], table["Severity"], table["Note"]):
+        by_drug = index.setdefault(normalize_basic(diag), {})
+        level = _parse_severity(sev)
+        if level > by_drug.get(drug, (0, ""))[0]:
+            by_drug[drug] = (level, str(note))
+    return index
+
+
+def regimen_cautions(cautions: dict, diagnosis, drug_names) -> pd.DataFrame:
+    """أدوية الروشتة اللي ليها تحذير مع التشخيص ده (lookup بالتشخيص ثم بالدوا)."""
+    cols = ["Drug_Name", "Diagnosis", "Severity", "Note"]
+    by_drug = cautions.get(normalize_basic(diagnosis)) if cautions and diagnosis else None
+    if not by_drug:
+        return pd.DataFrame(columns=cols)
+
+    rows = []
+    for name in dict.fromkeys(str(n).strip() for n in drug_names if n):
+        if name in by_drug:
+            level, note = by_drug[name]
+            rows.append({
+                "Drug_Name": name,
+                "Diagnosis": diagnosis,
+                "Severity": SEVERITY_LABELS.get(level, "moderate"),
+                "Note": note,
+            })
+    out = pd.DataFrame(rows, columns=cols)
+    order = out["Severity"].map(SEVERITY_LEVELS)
+    return out.loc[order.sort_values(ascending=False).index].reset_index(drop=True)
@@ -0,0 +1,120 @@
+# core/utils_growth.py
+# z-score / percentile للنمو (WHO LMS) لكل الزيارات مرة واحدة
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+
+# measure → (عمود القيمة في الزيارات، اسم عمود الـ z)
+GROWTH_MEASURES = {
+    "wfa": ("Weight_KG", "WFA_Z"),
+    "lhfa": ("Height_CM", "HFA_Z"),
+    "bfa": ("BMI", "BMI_Z"),
+}
+GROWTH_FEATURES = [z for _, z in GROWTH_MEASURES.values()]
+
+_SEX_FILES = {"Male": "boys", "Female": "girls"}
+_AGE_COLS = ("Month", "Age_Months", "Agemos")
+
+
+# =========================================================
+# تحميل جداول LMS
+# =========================================================
+def load_growth_tables(growth_dir) -> dict:
+    """
+    {(measure, "Male"/"Female"): (age_months, L, M, S)} كـ numpy arrays مترتبة.
+    الجداول الناقصة بتتجاهل (الـ z بتاعها يطلع NaN).
+    """
+    tables = {}
+    if growth_dir is None:
+        return tables
+    growth_dir = Path(growth_dir)
+    for measure in GROWTH_MEASURES:
+        for sex, suffix in _SEX_FILES.items():
+            path = growth_dir / f"{measure}_{suffix}.csv"
+            if not path.exists():
+                continue
+            df = pd.read_csv(path)
+            age_col = next((c for c in _AGE_COLS if c in df.columns), None)
+            if age_col is None or not {"L", "M", "S"}.issubset(df.columns):
+                continue
+            df = df[[age_col, "L", "M", "S"]].dropna().sort_values(age_col)
+            tables[(measure, sex)] = tuple(df[c].to_numpy(dtype=float) for c in (age_col, "L", "M", "S"))
+    return tables
+
+
+# =========================================================
+# حساب z-scores (vectorized)
+# =========================================================
+def _lms_z(x, age, table):
+    ages, L, M, S = table
+    inside = (age >= ages[0]) & (age <= ages[-1])
+    l = np.interp(age, ages, L)
+    m = np.interp(age, ages, M)
+    s = np.interp(age, ages, S)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(
+            np.abs(l) > 1e-6,
+            (np.power(x / m, l) - 1) / (l * s),
+            np.log(x / m) / s,
+        )
+    return np.where(inside & (x > 0), z, np.nan)
+
+
+def growth_zscores(visits, patients, tables) -> pd.DataFrame:
+    """
+    لكل زيارة: WFA_Z, HFA_Z, BMI_Z + percentiles (indexed بـ Visit_ID).
+    """
+    cols = ["Visit_ID", "Patient_ID", "Age_Months", "Weight_KG", "Height_CM"]
+    v = visits.reindex(columns=cols)
+    if patients is not None and "Gender" in patients.columns:
+        sex = patients.drop_duplicates("Patient_ID").set_index("Patient_ID")["Gender"]
+        v = v.assign(Gender=v["Patient_ID"].map(sex))
+    else:
+        v = v.assign(Gender=np.nan)
+
+    age = pd.to_numeric(v["Age_Months"], errors="coerce").to_numpy(dtype=float)
+    values = {
+        "Weight_KG": pd.to_numeric(v["Weight_KG"], errors="coerce").to_numpy(dtype=float),
+        "Height_CM": pd.to_numeric(v["Height_CM"], errors="coerce").to_numpy(dtype=float),
+    }
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values["BMI"] = values["Weight_KG"] / np.square(values["Height_CM"] / 100)
+
+    out = pd.DataFrame({"Visit_ID": v["Visit_ID"].to_numpy()})
+    gender = v["Gender"].to_numpy()
+    for measure, (value_col, z_col) in GROWTH_MEASURES.items():
+        z = np.full(len(v), np.nan)
+        for sex in _SEX_FILES:
+            table = tables.get((measure, sex))
+            if table is None:
+                continue
+            mask = gender == sex
+            if mask.any():
+                z[mask] = _lms_z(values[value_col][mask], age[mask], table)
+        out[z_col] = np.round(z, 2)
+        out[z_col.replace("_Z", "_PCT")] = np.round(ndtr(z) * 100, 1)
+
+    return out.set_index("Visit_ID")
+
+
+def growth_for_measurement(tables, gender, age_months, weight_kg, height_cm) -> dict:
+    """نفس الحساب لقياس واحد (مثلاً من فورم الزيارة قبل الحفظ)."""
+    row = pd.DataFrame([{
+        "Visit_ID": 0, "Patient_ID": 0, "Age_Months": age_months,
+        "Weight_KG": weight_kg or np.nan, "Height_CM": height_cm or np.nan,
+    }])
+    pts = pd.DataFrame([{"Patient_ID": 0, "Gender": gender}])
+    return growth_zscores(row, pts, tables).iloc[0].to_dict()
+
+
+def attach_growth_features(data_merged, growth) -> pd.DataFrame:
+    """يضيف أعمدة GROWTH_FEATURES للـ merged (لاستخدامها كـ features في الموديل)."""
+    if growth is None or growth.empty:
+        return data_merged.assign(**{c: np.nan for c in GROWTH_FEATURES})
+    return data_merged.merge(
+        growth[GROWTH_FEATURES], left_on="Visit_ID", right_index=True, how="left"
+    )
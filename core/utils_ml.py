@@ -1,19 +1,62 @@
 # core/utils_ml.py
 # مسؤول عن بناء موديل ML + التوصية بالأدوية + بناء الـ Engine
 
+import threading
+
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 from sklearn.linear_model import LogisticRegression
 import joblib
 
-from .utils_data import load_data, df_base_clean
+from .utils_data import (
+    load_data,
+    df_base_clean,
+    add_cohort_bins,
+    build_patient_timeline,
+    timeline_add_visit,
+)
+from .utils_drugs import (
+    apply_drug_canon,
+    build_drug_canon_index,
+    build_allergen_index,
+    allergy_matches,
+    load_interaction_table,
+    build_interaction_matrix,
+    regimen_interactions,
+    load_caution_table,
+    build_caution_index,
+)
+from .utils_growth import (
+    GROWTH_FEATURES,
+    load_growth_tables,
+    growth_zscores,
+    growth_for_measurement,
+    attach_growth_features,
+)
+from .utils_search import build_patient_index, index_add_patient
+from .utils_trends import (
+    build_trend_cube,
+    update_trend_cube,
+    build_outbreak_detector,
+    outbreak_add_visit,
+)
 from .utils_analytics import (
-    analysis_a1,
-    dose_ranges,
+    get_analytics,
+    engine_lock,
+    engine_append,
+    engine_frame,
+    update_dose_stats,
+    build_drug_diag_counters,
+    update_drug_diag_counters,
+    build_regimen_templates,
+    update_regimen_templates,
+    dose_running_stats,
+    build_recurrence,
     recurrence_summary,
     recurrence_table,
 )
@@ -22,16 +65,20 @@ from .utils_analytics import (
 # =========================================================
 # 1) بناء الـ Pipeline
 # =========================================================
-def build_pipe():
+def build_pipe(growth=False):
     cat_cols = ["Diagnosis", "Chief_Complaint", "Gender"]
     num_cols = ["Age_Months", "Weight_KG"]
 
-    preprocess = ColumnTransformer(
-        [
-            ("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols),
-            ("num", "passthrough", num_cols),
-        ]
-    )
+    transformers = [
+        ("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols),
+        ("num", "passthrough", num_cols),
+    ]
+    if growth:
+        # z-score ناقص (مفيش طول / برّه مدى جداول WHO) = 0 يعني الوسيط
+        transformers.append(
+            ("growth", SimpleImputer(strategy="constant", fill_value=0.0), GROWTH_FEATURES)
+        )
+    preprocess = ColumnTransformer(transformers)
     clf = LogisticRegression(max_iter=1000)
     pipe = Pipeline([("prep", preprocess), ("clf", clf)])
     return pipe
@@ -75,10 +122,15 @@ def auto_train_test_split(X, y, sample_weight, test_size=0.2, random_state=42):
 # =========================================================
 # 3) تدريب الموديل
 # =========================================================
-def train_model(data_merged):
+def train_model(data_merged, growth=None):
     """
     Train ML Recommender v1.
+    growth: نتيجة growth_zscores (اختياري) → WFA_Z / HFA_Z / BMI_Z كـ features إضافية.
     """
+    use_growth = growth is not None and not growth.empty and growth[GROWTH_FEATURES].notna().any().any()
+    if use_growth:
+        data_merged = attach_growth_features(data_merged, growth)
+
     df_ml = data_merged.dropna(
         subset=[
             "Diagnosis",
@@ -91,13 +143,14 @@ def train_model(data_merged):
         ]
     )
 
-    X = df_ml[["Diagnosis", "Chief_Complaint", "Age_Months", "Weight_KG", "Gender"]]
+    feature_cols = ["Diagnosis", "Chief_Complaint", "Age_Months", "Weight_KG", "Gender"]
+    X = df_ml[feature_cols + (GROWTH_FEATURES if use_growth else [])]
     y = df_ml["Drug_Name"]
     sample_weight = df_ml["Outcome_Class"].apply(
         lambda x: 2 if x == "Cured" else 1
     ).values
 
-    pipe = build_pipe()
+    pipe = build_pipe(growth=use_growth)
 
     X_train, X_test, y_train, y_test, w_train, w_test = auto_train_test_split(
         X, y, sample_weight
@@ -117,6 +170,25 @@ def load_model(model_path):
     return joblib.load(model_path)
 
 
+def model_matches_vocab(pipe, data_merged):
+    """
+    الموديل المحفوظ صالح بس لو كل الـ classes بتاعته أسماء أدوية موحّدة موجودة في الداتا
+    (لو اتدرب قبل التوحيد أو الـ Drug_List اتغيرت → لازم يتدرب تاني).
+    """
+    try:
+        classes = set(pipe.named_steps["clf"].classes_)
+    except (AttributeError, KeyError):
+        return False
+    return classes <= set(data_merged["Drug_Name"].dropna().unique())
+
+
+def model_uses_growth(pipe):
+    try:
+        return "growth" in pipe.named_steps["prep"].named_transformers_
+    except (AttributeError, KeyError):
+        return False
+
+
 # =========================================================
 # 5) جداول نجاح/فشل الأدوية لطفل معيّن
 # =========================================================
@@ -181,6 +253,11 @@ def recommend_drugs_a3(
     drug_diag_stats=None,
     dose_stats_df=None,
     data_merged=None,
+    allergen_index=None,
+    interactions=None,
+    recurrence=None,
+    growth_tables=None,
+    height_cm=None,
 ):
     """
     Enhanced recommendation:
@@ -188,6 +265,7 @@ def recommend_drugs_a3(
     - Patient history boost/penalty
     - Recurrence-aware weighting
     - Safety rules (allergy, failed>=threshold)
+    - Drug–drug interactions inside the final regimen
     - Exclusion log
     """
 
@@ -205,6 +283,13 @@ def recommend_drugs_a3(
             }
         ]
     )
+    # growth features (الموديلات القديمة بتتجاهل الأعمدة الزيادة)
+    growth = (
+        growth_for_measurement(growth_tables, gender, age_months, weight_kg, height_cm)
+        if growth_tables else {}
+    )
+    for col in GROWTH_FEATURES:
+        row[col] = growth.get(col, np.nan)
 
     probs = pipe.predict_proba(row)[0]
     drugs = pipe.named_steps["clf"].classes_
@@ -254,7 +339,9 @@ def recommend_drugs_a3(
     candidates["final_score"] -= 0.05 * candidates["fail_count_patient"]
 
     # ---------------- Recurrence-aware ----------------
-    rec_sum = recurrence_summary(patient_id, data_merged)
+    if recurrence is None:
+        recurrence = build_recurrence(data_merged)
+    rec_sum = recurrence_summary(patient_id, recurrence=recurrence)
     rec_map = (
         dict(zip(rec_sum["Diagnosis"], rec_sum["recurrence_count"]))
         if not rec_sum.empty
@@ -273,12 +360,15 @@ def recommend_drugs_a3(
 
     # ---------------- Safety: Allergies ----------------
     if allergies_text:
-        al = allergies_text.lower()
-        mask_allergy = (
-            candidates["Drug_Name"].str.lower().str.contains(al, na=False)
-        )
-        candidates.loc[mask_allergy, "excluded"] = True
-        candidates.loc[mask_allergy, "exclusion_reason"] += "Allergy; "
+        if allergen_index is None:
+            allergen_index = build_allergen_index(None, extra_drugs=tuple(drugs))
+        allergy_map = allergy_matches(allergen_index, allergies_text, drug_names=tuple(drugs))
+        if allergy_map:
+            mask_allergy = candidates["Drug_Name"].isin(list(allergy_map))
+            candidates.loc[mask_allergy, "excluded"] = True
+            candidates.loc[mask_allergy, "exclusion_reason"] += (
+                "Allergy (" + candidates.loc[mask_allergy, "Drug_Name"].map(allergy_map) + "); "
+            )
 
     # ---------------- Safety: failed >= threshold ----------------
     mask_fail = candidates["fail_count_patient"] >= fail_threshold
@@ -313,7 +403,8 @@ def recommend_drugs_a3(
         "worked_table": worked,
         "failed_table": failed,
         "recurrence_summary": rec_sum,
-        "recurrence_timeline": recurrence_table(patient_id, data_merged),
+        "recurrence_timeline": recurrence_table(patient_id, recurrence=recurrence),
+        "interactions": regimen_interactions(interactions, final_tbl["Drug_Name"].tolist()),
     }
 
 
@@ -327,6 +418,7 @@ def recommend_drugs_final(
     gender,
     allergies_text=None,
     k=3,
+    height_cm=None,
 ):
     """Wrapper سهل للاستخدام من الواجهة."""
     return recommend_drugs_a3(
@@ -340,23 +432,39 @@ def recommend_drugs_final(
         k=k,
         pipe=engine["pipe"],
         drug_diag_stats=engine["drug_diag_stats"],
-        dose_stats_df=engine["dose_stats"],
-        data_merged=engine["data_merged"],
+        dose_stats_df=get_analytics(engine, "dose_stats"),
+        data_merged=engine_frame(engine, "data_merged"),
+        allergen_index=engine.get("allergen_index"),
+        interactions=engine.get("interactions"),
+        recurrence=get_analytics(engine, "recurrence"),
+        growth_tables=engine.get("growth_tables"),
+        height_cm=height_cm,
     )
 
 
 # =========================================================
 # 7) Engine Builder (يستخدم في الواجهة)
 # =========================================================
-def build_engine(file_path, model_path=None, retrain_if_missing=True):
+def build_engine(
+    file_path,
+    model_path=None,
+    retrain_if_missing=True,
+    interactions_path=None,
+    cautions_path=None,
+    outbreak_params=None,
+    growth_dir=None,
+):
     """
     تحميل الداتا + تحليلات أساسية + الموديل في dict واحد.
     """
     patients, visits, visit_drugs, ref, data_merged = load_data(file_path)
 
     df_base = df_base_clean(data_merged)
-    drug_diag_stats = analysis_a1(data_merged)
-    dose_stats_df = dose_ranges(data_merged)
+    drug_diag_counters = build_drug_diag_counters(data_merged)
+    trend_cube = build_trend_cube(data_merged)
+    outbreak = build_outbreak_detector(visits, **(outbreak_params or {}))
+    dose_live_stats = dose_running_stats(data_merged)
+    growth_tables = load_growth_tables(growth_dir)
 
     pipe = None
     if model_path:
@@ -364,20 +472,164 @@ def build_engine(file_path, model_path=None, retrain_if_missing=True):
             pipe = load_model(model_path)
         except Exception:
             pipe = None
+        # موديل قديم (أسماء أدوية قبل التوحيد / من غير growth features والجداول موجودة) → يتدرب تاني
+        if pipe is not None and (
+            not model_matches_vocab(pipe, data_merged)
+            or model_uses_growth(pipe) != bool(growth_tables)
+        ):
+            pipe = None
 
     if pipe is None and retrain_if_missing:
-        pipe = train_model(data_merged)
+        growth = growth_zscores(visits, patients, growth_tables) if growth_tables else None
+        pipe = train_model(data_merged, growth=growth)
         if model_path:
             save_model(pipe, model_path)
 
-    return {
+    drug_canon = build_drug_canon_index(ref)
+    interactions = build_interaction_matrix(
+        load_interaction_table(ref, interactions_path), drug_canon
+    )
+    cautions = build_caution_index(load_caution_table(cautions_path), drug_canon)
+    allergen_index = build_allergen_index(
+        ref,
+        extra_drugs=tuple(data_merged["Drug_Name"].dropna().unique()),
+    )
+
+    engine = {
+        "file_path": file_path,
         "patients": patients,
+        "patient_index": build_patient_index(patients),
         "visits": visits,
         "visit_drugs": visit_drugs,
         "ref": ref,
         "data_merged": data_merged,
+        "timeline": build_patient_timeline(data_merged),
         "df_base": df_base,
-        "drug_diag_stats": drug_diag_stats,
-        "dose_stats": dose_stats_df,
+        "drug_diag_counters": drug_diag_counters,
+        "regimen_templates": build_regimen_templates(data_merged),
+        "trend_cube": trend_cube,
+        "outbreak": outbreak,
+        "growth_tables": growth_tables,
+        # dose_stats / dose_suggestions: get_analytics (بيتحسبوا تاني بعد أي زيارة جديدة)
+        "dose_live_stats": dose_live_stats,
         "pipe": pipe,
+        "drug_canon": drug_canon,
+        "allergen_index": allergen_index,
+        "interactions": interactions,
+        "cautions": cautions,
+        # نسخة كل شيت – بتزيد مع كل حفظ (تستخدم في cache التحليلات)
+        "versions": {"patients": 1, "visits": 1, "visit_drugs": 1, "ref": 1},
+        "next_ids": {
+            "patient": _next_id(patients, "Patient_ID", 1001),
+            "visit": _next_id(visits, "Visit_ID", 2001),
+        },
+        "analytics_cache": {},
+        # الـ Engine متشارك بين الـ sessions: أي تعديل تحت الـ lock،
+        # والسطور الجديدة بتستنى في pending لحد أول قراءة (engine_frame)
+        "lock": threading.RLock(),
+        "pending": {},
     }
+    # A-1 (drug_diag_stats) = view مشتق من العدّادات
+    engine["drug_diag_stats"] = get_analytics(engine, "a1")
+    return engine
+
+
+# =========================================================
+# 8) تحديث الـ Engine بعد الحفظ (بدل إعادة البناء الكامل)
+# =========================================================
+def _bump(engine, *sheets):
+    versions = engine.setdefault("versions", {})
+    for s in sheets:
+        versions[s] = versions.get(s, 0) + 1
+
+
+def _next_id(df, col, start_from):
+    # نفس منطق get_next_patient_id / get_next_visit_id بس من الذاكرة
+    if df is None or df.empty or col not in df.columns:
+        return start_from
+    max_id = pd.to_numeric(df[col], errors="coerce").max()
+    return start_from if pd.isna(max_id) else max(int(max_id) + 1, start_from)
+
+
+def _advance_id(engine, kind, used_id):
+    next_ids = engine.setdefault("next_ids", {})
+    try:
+        next_ids[kind] = max(next_ids.get(kind, 0), int(used_id) + 1)
+    except (TypeError, ValueError):
+        pass
+
+
+def engine_snapshot(engine):
+    """
+    الداتا الحالية من الـ Engine (من غير أي قراءة للإكسل):
+    (patients, visits, visit_drugs, ref, data_merged) – بنفس ترتيب load_data.
+    """
+    return (
+        engine_frame(engine, "patients"),
+        engine_frame(engine, "visits"),
+        engine_frame(engine, "visit_drugs"),
+        engine["ref"],
+        engine_frame(engine, "data_merged"),
+    )
+
+
+def engine_next_patient_id(engine):
+    return engine["next_ids"]["patient"]
+
+
+def engine_next_visit_id(engine):
+    return engine["next_ids"]["visit"]
+
+
+def engine_add_patient(engine, patient_row):
+    """
+    يضيف مريض جديد للـ Engine بعد save_patient.
+    """
+    new_df = pd.DataFrame([patient_row])
+    if "DOB" in new_df.columns:
+        new_df["DOB"] = pd.to_datetime(new_df["DOB"], errors="coerce")
+    with engine_lock(engine):
+        engine_append(engine, "patients", new_df)
+        if "patient_index" in engine:
+            index_add_patient(engine["patient_index"], patient_row)
+        _bump(engine, "patients")
+        _advance_id(engine, "patient", patient_row.get("Patient_ID"))
+    return engine
+
+
+def engine_add_visit(engine, visit_row, drug_rows=None):
+    """
+    يضيف زيارة + سطور الروشتة للـ Engine بعد save_visit/save_visit_drugs
+    ويبطّل التحليلات المعتمدة على Visits/Visit_Drugs بس.
+    """
+    new_visit = pd.DataFrame([visit_row])
+    new_visit["Visit_Date"] = pd.to_datetime(new_visit["Visit_Date"], errors="coerce")
+
+    if isinstance(drug_rows, dict):
+        drug_rows = [drug_rows]
+    new_drugs = pd.DataFrame(drug_rows or [])
+    if not new_drugs.empty:
+        new_drugs = apply_drug_canon(new_drugs, engine["drug_canon"])
+        new_merged = new_visit.merge(new_drugs, on="Visit_ID", how="left")
+    else:
+        new_merged = new_visit
+    new_merged = add_cohort_bins(new_merged)
+
+    with engine_lock(engine):
+        engine_append(engine, "visits", new_visit)
+        engine_append(engine, "visit_drugs", new_drugs)
+        engine_append(engine, "data_merged", new_merged)
+        engine_append(engine, "df_base", df_base_clean(new_merged))
+        if "timeline" in engine:
+            timeline_add_visit(engine["timeline"], new_merged)
+        _bump(engine, "visits", "visit_drugs")
+        _advance_id(engine, "visit", visit_row.get("Visit_ID"))
+
+        update_dose_stats(engine.setdefault("dose_live_stats", {}), new_merged)
+        update_drug_diag_counters(engine["drug_diag_counters"], new_merged)
+        if "regimen_templates" in engine:
+            update_regimen_templates(engine["regimen_templates"], new_merged)
+        update_trend_cube(engine["trend_cube"], new_merged)
+        outbreak_add_visit(engine["outbreak"], visit_row.get("Diagnosis"), visit_row.get("Visit_Date"))
+        engine["drug_diag_stats"] = get_analytics(engine, "a1")
+    return engine
@@ -0,0 +1,152 @@
+# core/utils_quality.py
+# فحص جودة البيانات بقراءة ملف الإكسل على دفعات (بدون نسخة كاملة في الذاكرة)
+
+from collections import defaultdict
+
+import pandas as pd
+from openpyxl import load_workbook
+
+
+# الترتيب مهم: Patients ثم Visits ثم Visit_Drugs علشان فحص الـ orphans
+SHEET_ORDER = ["Patients", "Visits", "Visit_Drugs"]
+
+NUMERIC_COLS = {
+    "Patients": ["Patient_ID"],
+    "Visits": ["Visit_ID", "Patient_ID", "Age_Months", "Weight_KG", "Height_CM", "Recovery_Days"],
+    "Visit_Drugs": ["Visit_ID", "Line_No", "Dose_Value", "Freq_Value", "Duration_Days"],
+}
+DATE_COLS = {
+    "Patients": ["DOB"],
+    "Visits": ["Visit_Date"],
+}
+# (min, max) مسموح – أي قيمة برّه المدى = out of range
+RANGES = {
+    "Visits": {
+        "Age_Months": (0, 216),
+        "Weight_KG": (0.3, 150),
+        "Height_CM": (30, 210),
+        "Recovery_Days": (0, 365),
+    },
+    "Visit_Drugs": {
+        "Dose_Value": (1e-6, 5000),
+        "Freq_Value": (0, 24),
+        "Duration_Days": (0, 180),
+    },
+}
+ID_KEYS = {
+    "Patients": ["Patient_ID"],
+    "Visits": ["Visit_ID"],
+    "Visit_Drugs": ["Visit_ID", "Line_No"],
+}
+
+
+def _iter_chunks(ws, chunk_size):
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    header = [str(h) if h is not None else f"col_{i}" for i, h in enumerate(header)]
+    buf = []
+    for r in rows:
+        if r is None or all(v is None for v in r):
+            continue
+        buf.append(r)
+        if len(buf) >= chunk_size:
+            yield pd.DataFrame(buf, columns=header)
+            buf = []
+    if buf:
+        yield pd.DataFrame(buf, columns=header)
+
+
+def _new_sheet_stats():
+    return {
+        "rows": 0,
+        "nulls": defaultdict(int),
+        "type_violations": defaultdict(int),
+        "out_of_range": defaultdict(int),
+        "duplicate_ids": 0,
+    }
+
+
+def profile_workbook(file_path, chunk_size=5000):
+    """
+    يرجّع dict:
+    - sheets: {sheet: {rows, nulls, type_violations, out_of_range, duplicate_ids}}
+    - orphans: {"visits_without_patient", "drug_lines_without_visit"}
+    الذاكرة = chunk واحد + sets بالـ IDs فقط.
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    seen_ids = {s: set() for s in SHEET_ORDER}
+    parent_ids = {}  # sheet → set of first-key IDs (بعد ما الشيت يخلص)
+    sheets = {}
+    orphans = {"visits_without_patient": 0, "drug_lines_without_visit": 0}
+
+    try:
+        for sheet in SHEET_ORDER:
+            if sheet not in wb.sheetnames:
+                continue
+            stats = sheets[sheet] = _new_sheet_stats()
+            for chunk in _iter_chunks(wb[sheet], chunk_size):
+                stats["rows"] += len(chunk)
+                for col, n in chunk.isna().sum().items():
+                    stats["nulls"][col] += int(n)
+
+                for col in NUMERIC_COLS.get(sheet, []):
+                    if col not in chunk.columns:
+                        continue
+                    raw = chunk[col]
+                    num = pd.to_numeric(raw, errors="coerce")
+                    stats["type_violations"][col] += int((raw.notna() & num.isna()).sum())
+                    lo_hi = RANGES.get(sheet, {}).get(col)
+                    if lo_hi is not None:
+                        bad = num.notna() & ((num < lo_hi[0]) | (num > lo_hi[1]))
+                        stats["out_of_range"][col] += int(bad.sum())
+
+                for col in DATE_COLS.get(sheet, []):
+                    if col in chunk.columns:
+                        raw = chunk[col]
+                        dt = pd.to_datetime(raw, errors="coerce")
+                        stats["type_violations"][col] += int((raw.notna() & dt.isna()).sum())
+
+                keys = [k for k in ID_KEYS[sheet] if k in chunk.columns]
+                if keys:
+                    ids = list(chunk[keys].itertuples(index=False, name=None))
+                    for key in ids:
+                        if key in seen_ids[sheet]:
+                            stats["duplicate_ids"] += 1
+                        else:
+                            seen_ids[sheet].add(key)
+
+                if sheet == "Visits" and "Patient_ID" in chunk.columns and parent_ids.get("Patients"):
+                    orphans["visits_without_patient"] += int(
+                        (~chunk["Patient_ID"].isin(parent_ids["Patients"])).sum()
+                    )
+                if sheet == "Visit_Drugs" and "Visit_ID" in chunk.columns and parent_ids.get("Visits"):
+                    orphans["drug_lines_without_visit"] += int(
+                        (~chunk["Visit_ID"].isin(parent_ids["Visits"])).sum()
+                    )
+
+            parent_ids[sheet] = {k[0] for k in seen_ids[sheet]}
+    finally:
+        wb.close()
+
+    return {"sheets": sheets, "orphans": orphans}
+
+
+def profile_frame(profile):
+    """تحويل نتيجة profile_workbook لجدول (شيت، عمود، مقياس، قيمة) للعرض."""
+    rows = []
+    for sheet, s in profile["sheets"].items():
+        n = max(s["rows"], 1)
+        rows.append({"sheet": sheet, "column": "", "check": "rows", "value": s["rows"]})
+        rows.append({"sheet": sheet, "column": "", "check": "duplicate_ids", "value": s["duplicate_ids"]})
+        for col, k in s["nulls"].items():
+            if k:
+                rows.append({"sheet": sheet, "column": col, "check": "null_rate", "value": round(k / n, 3)})
+        for check in ("type_violations", "out_of_range"):
+            for col, k in s[check].items():
+                if k:
+                    rows.append({"sheet": sheet, "column": col, "check": check, "value": k})
+    for check, k in profile["orphans"].items():
+        rows.append({"sheet": "", "column": "", "check": check, "value": k})
+    return pd.DataFrame(rows, columns=["sheet", "column", "check", "value"])
@@ -0,0 +1,136 @@
+# core/utils_query.py
+# فهارس أعمدة على data_merged لاستعلامات سريعة (تشخيص/دواء/نتيجة/تاريخ/عمر)
+
+import numpy as np
+import pandas as pd
+
+from .utils_data import age_band_codes, AGE_BAND_LABELS
+
+
+CATEGORICAL_COLS = ["Diagnosis", "Drug_Name", "Outcome_Class"]
+
+RESULT_COLS = [
+    "Visit_ID", "Patient_ID", "Visit_Date", "Age_Months", "Weight_KG",
+    "Diagnosis", "Drug_Name", "Dose_Value", "Dose_Unit", "Outcome_Class", "Recovery_Days",
+]
+
+
+def _sorted_positions(values):
+    """(القيم مرتبة، مواضعها) – القيم الناقصة برّه الفهرس."""
+    valid = np.flatnonzero(~pd.isna(values))
+    order = valid[np.argsort(values[valid], kind="mergesort")]
+    return values[order], order
+
+
+# =========================================================
+# بناء الفهرس
+# =========================================================
+def build_query_index(data_merged):
+    """
+    يرجّع dict:
+    - frame: data_merged (RangeIndex) – النتائج بتتقرا منه بالـ iloc
+    - codes / categories: factorize لكل عمود تصنيفي (كود لكل سطر + القيم)
+    - dates / date_order: Visit_Date مرتب + مواضعه (searchsorted)، و date_rank: ترتيب كل سطر
+    - ages / age_order: Age_Months مرتب + مواضعه، و age_band: كود شريحة العمر
+    """
+    frame = data_merged.reset_index(drop=True)
+    n = len(frame)
+    index = {"frame": frame, "n": n, "codes": {}, "categories": {}, "code_of": {}}
+
+    for col in CATEGORICAL_COLS:
+        if col in frame.columns:
+            codes, cats = pd.factorize(frame[col], sort=True)
+        else:
+            codes, cats = np.full(n, -1), pd.Index([])
+        index["codes"][col] = codes
+        index["categories"][col] = list(cats)
+        index["code_of"][col] = {v: i for i, v in enumerate(cats)}
+
+    cols = frame.reindex(columns=["Visit_Date", "Age_Months"])
+    dates = pd.to_datetime(cols["Visit_Date"], errors="coerce").to_numpy(dtype="datetime64[ns]")
+    index["dates"], index["date_order"] = _sorted_positions(dates)
+    # السطور من غير تاريخ بتاخد -1 (آخر النتيجة)
+    index["date_rank"] = np.full(n, -1, dtype=np.int64)
+    index["date_rank"][index["date_order"]] = np.arange(len(index["date_order"]))
+
+    ages = pd.to_numeric(cols["Age_Months"], errors="coerce").to_numpy(dtype=float)
+    index["ages"], index["age_order"] = _sorted_positions(ages)
+    index["age_band"] = age_band_codes(ages)
+    return index
+
+
+# =========================================================
+# الاستعلام
+# =========================================================
+def _range_mask(sorted_vals, order, n, lo=None, hi=None):
+    start = 0 if lo is None else np.searchsorted(sorted_vals, lo, side="left")
+    end = len(sorted_vals) if hi is None else np.searchsorted(sorted_vals, hi, side="right")
+    mask = np.zeros(n, dtype=bool)
+    mask[order[start:end]] = True
+    return mask
+
+
+def query_visits(
+    index,
+    diagnoses=None,
+    drugs=None,
+    outcomes=None,
+    date_from=None,
+    date_to=None,
+    age_min_months=None,
+    age_max_months=None,
+    age_bands=None,
+):
+    """
+    مواضع السطور (np.ndarray) اللي بتحقق كل الفلاتر – كل فلتر mask
+    والنتيجة تقاطعهم. الفلتر الفاضي/None = مفيش قيد.
+    """
+    n = index["n"]
+    mask = np.ones(n, dtype=bool)
+
+    for col, values in (("Diagnosis", diagnoses), ("Drug_Name", drugs), ("Outcome_Class", outcomes)):
+        if values:
+            code_of = index["code_of"][col]
+            wanted = [code_of[v] for v in values if v in code_of]
+            mask &= np.isin(index["codes"][col], wanted)
+
+    if date_from is not None or date_to is not None:
+        lo = hi = None
+        if date_from is not None:
+            lo = pd.Timestamp(date_from).normalize().to_datetime64()
+        if date_to is not None:
+            # لحد آخر اليوم
+            hi = (pd.Timestamp(date_to).normalize() + pd.Timedelta(days=1, nanoseconds=-1)).to_datetime64()
+        mask &= _range_mask(index["dates"], index["date_order"], n, lo, hi)
+
+    if age_min_months is not None or age_max_months is not None:
+        mask &= _range_mask(index["ages"], index["age_order"], n, age_min_months, age_max_months)
+
+    if age_bands:
+        wanted = [AGE_BAND_LABELS.index(b) for b in age_bands if b in AGE_BAND_LABELS]
+        mask &= np.isin(index["age_band"], wanted)
+
+    return np.flatnonzero(mask)
+
+
+def query_summary(index, positions):
+    """عدد السطور + الزيارات + المرضى في النتيجة."""
+    frame = index["frame"]
+    out = {"rows": int(len(positions)), "visits": 0, "patients": 0}
+    if len(positions):
+        if "Visit_ID" in frame.columns:
+            out["visits"] = int(frame["Visit_ID"].iloc[positions].nunique())
+        if "Patient_ID" in frame.columns:
+            out["patients"] = int(frame["Patient_ID"].iloc[positions].nunique())
+    return out
+
+
+def query_page(index, positions, page=1, page_size=50, columns=None):
+    """صفحة واحدة من النتيجة (الأحدث الأول) – بيتقري من الـ frame الصفوف دي بس."""
+    frame = index["frame"]
+    # الأحدث الأول – الترتيب على مواضع النتيجة بس
+    positions = positions[np.argsort(-index["date_rank"][positions], kind="mergesort")]
+
+    start = max(page - 1, 0) * page_size
+    cols = [c for c in (columns or RESULT_COLS) if c in frame.columns]
+    return frame.iloc[positions[start:start + page_size]][cols]
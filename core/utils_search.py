@@ -0,0 +1,306 @@
+# core/utils_search.py
+# فهرس بحث المرضى (اسم/هاتف/رقم) – بيتبني مرة مع الـ Engine ويتحدث مع كل حفظ
+
+import heapq
+from bisect import bisect_left, insort
+from collections import Counter
+
+import pandas as pd
+
+from .utils_text import normalize_name, name_skeleton, digits_only, digits_only_series, trigrams, dice_similarity
+
+
+def _phone_key(phone) -> str:
+    """
+    الرقم المحلي من غير كود الدولة ولا الصفر: 01012345678 / +20 1012345678 /
+    00201012345678 / 1012345678 (الإكسل بيشيل الصفر من الأرقام) → 1012345678.
+    """
+    if isinstance(phone, float) and phone.is_integer():
+        phone = int(phone)
+    d = digits_only(phone)
+    if d.startswith("00"):
+        d = d[2:]
+    if d.startswith("20") and len(d) == 12:
+        d = d[2:]
+    return d.lstrip("0")
+
+
+def _phone_keys(phones: pd.Series) -> pd.Series:
+    """_phone_key على العمود كله مرة واحدة (نفس القواعد – بناء الفهرس)."""
+    s = phones.astype(object)
+    # أرقام صحيحة جاية float من الإكسل (1012345678.0) → من غير ".0"
+    num = pd.to_numeric(s.where(s.map(lambda v: isinstance(v, float))), errors="coerce")
+    whole = num.notna() & (num % 1 == 0)
+    s = s.where(~whole, num[whole].astype("int64").astype(str))
+    d = digits_only_series(s)
+    d = d.where(~d.str.startswith("00"), d.str[2:])
+    d = d.where(~(d.str.startswith("20") & (d.str.len() == 12)), d.str[2:])
+    return d.str.lstrip("0")
+
+
+_MAX_CHAR = "\uffff"
+
+
+def _prefix_range(sorted_keys, prefix):
+    return bisect_left(sorted_keys, prefix), bisect_left(sorted_keys, prefix + _MAX_CHAR)
+
+
+# الهيكل بيجمع أسماء مختلفة أكتر من الاسم نفسه – وزنه أقل شوية
+SKELETON_WEIGHT = 0.85
+
+
+def _name_grams(norm, skeleton):
+    # trigrams الاسم نفسه + trigrams الهيكل (بعلامة # علشان ما يختلطوش)
+    return trigrams(norm) | {"#" + g for g in trigrams(skeleton)}
+
+
+def _name_score(q_norm, q_skel, norm, skeleton):
+    return max(
+        dice_similarity(trigrams(q_norm), trigrams(norm)),
+        SKELETON_WEIGHT * dice_similarity(trigrams(q_skel), trigrams(skeleton)),
+    )
+
+
+# =========================================================
+# بناء + تحديث الفهرس
+# =========================================================
+def build_patient_index(patients):
+    """
+    يرجّع dict:
+    - ids: Patient_ID لكل مريض (بترتيب الإضافة) + names: الاسم المتطبّع + labels: الاسم للعرض
+    - vocab: كل الكلمات المتطبّعة sorted (prefix search بـ bisect)
+    - postings: كلمة → list بمواضع المرضى
+    - phones: list مرتبة من (رقم متطبّع, موضع) + phones_rev: نفس الأرقام معكوسة (بحث بآخر الرقم)
+    - pos_of: Patient_ID → موضع
+    - grams / skeletons: trigram postings للبحث التقريبي
+    - dobs / parents: تاريخ الميلاد + اسم ولي الأمر المتطبّع (تأكيد المرضى المكررين)
+    """
+    index = {
+        "ids": [], "names": [], "labels": [], "vocab": [], "postings": {}, "phones": [], "phones_rev": [],
+        "pos_of": {}, "skeletons": [], "grams": {}, "dobs": [], "parents": [],
+    }
+    if patients is None or patients.empty:
+        return index
+    p = patients.reindex(columns=["Patient_ID", "Patient_Name", "Phone_Number", "DOB", "Parent_Name"])
+    # مفاتيح الهاتف وتاريخ الميلاد للعمود كله مرة واحدة – مش parse لكل صف
+    phone_keys = _phone_keys(p["Phone_Number"]).tolist()
+    dob_keys = _dob_keys(p["DOB"]).tolist()
+    for pid, name, phone_key, dob_key, parent in zip(
+        p["Patient_ID"], p["Patient_Name"], phone_keys, dob_keys, p["Parent_Name"]
+    ):
+        _add(index, pid, name, phone_key, dob_key, parent, keep_sorted=False)
+    index["vocab"] = sorted(index["postings"])
+    index["phones"].sort()
+    index["phones_rev"].sort()
+    return index
+
+
+def _dob_key(dob) -> str:
+    d = pd.to_datetime(dob, errors="coerce")
+    return "" if pd.isna(d) else d.strftime("%Y-%m-%d")
+
+
+def _dob_keys(dobs: pd.Series) -> pd.Series:
+    return pd.to_datetime(dobs, errors="coerce").dt.strftime("%Y-%m-%d").fillna("")
+
+
+def _add(index, pid, name, phone_key, dob_key="", parent=None, keep_sorted=True):
+    try:
+        pid = int(pid)
+    except (TypeError, ValueError):
+        return
+    pos = len(index["ids"])
+    norm = normalize_name(name)
+    index["ids"].append(pid)
+    index["names"].append(norm)
+    index["labels"].append("" if pd.isna(name) else str(name).strip())
+    index["pos_of"][pid] = pos
+    index["dobs"].append(dob_key)
+    index["parents"].append(normalize_name(parent) if isinstance(parent, str) else "")
+
+    skeleton = name_skeleton(norm)
+    index["skeletons"].append(skeleton)
+    for g in _name_grams(norm, skeleton):
+        index["grams"].setdefault(g, []).append(pos)
+
+    for tok in set(norm.split()):
+        plist = index["postings"].get(tok)
+        if plist is None:
+            index["postings"][tok] = [pos]
+            if keep_sorted:
+                insort(index["vocab"], tok)
+        else:
+            plist.append(pos)
+
+    if phone_key:
+        for name, k in (("phones", phone_key), ("phones_rev", phone_key[::-1])):
+            if keep_sorted:
+                insort(index[name], (k, pos))
+            else:
+                index[name].append((k, pos))
+
+
+def index_add_patient(index, patient_row):
+    """إضافة مريض واحد بعد save_patient."""
+    _add(
+        index,
+        patient_row.get("Patient_ID"),
+        patient_row.get("Patient_Name"),
+        _phone_key(patient_row.get("Phone_Number")),
+        _dob_key(patient_row.get("DOB")),
+        patient_row.get("Parent_Name"),
+    )
+    return index
+
+
+# =========================================================
+# البحث
+# =========================================================
+def _phone_matches(index, digits, name="phones"):
+    # (key,) أصغر من أي (key, pos) – فالمقارنة على الرقم بس
+    phones = index.get(name, [])
+    lo = bisect_left(phones, (digits,))
+    hi = bisect_left(phones, (digits + _MAX_CHAR,))
+    return [pos for _, pos in phones[lo:hi]]
+
+
+def search_patients(index, query, limit=20):
+    """
+    بحث مرتب: list من (Patient_ID, score).
+    - أرقام بس: رقم المريض (exact) + الهاتف (بدايته أو آخره)
+    - نص: كل كلمة في البحث لازم تطابق بداية كلمة في الاسم (AND)،
+      والكلمة المطابقة بالكامل بتاخد وزن أعلى.
+    """
+    scores = {}
+    digits = digits_only(query)
+    norm = normalize_name(query)
+
+    if digits and digits == norm.replace(" ", ""):
+        pos = index["pos_of"].get(int(digits))
+        if pos is not None:
+            scores[pos] = 100.0
+        key = _phone_key(digits)
+        for pos in (_phone_matches(index, key) if key else ()):
+            scores[pos] = max(scores.get(pos, 0.0), 50.0 + len(key))
+        # آخر الرقم (زي "0595623") – الـ phones_rev مرتبة بالرقم معكوس
+        for q in {key, digits}:
+            for pos in (_phone_matches(index, q[::-1], "phones_rev") if q else ()):
+                scores[pos] = max(scores.get(pos, 0.0), 49.0 + len(q))
+
+    tokens = norm.split()
+    if tokens:
+        vocab, postings = index["vocab"], index["postings"]
+        candidates = None
+        tok_scores = {}
+        # الكلمات الأطول الأول – أقل مرشحين
+        for q in sorted(set(tokens), key=len, reverse=True):
+            lo, hi = _prefix_range(vocab, q)
+            hit = {}
+            for word in vocab[lo:hi]:
+                w = 2.0 if word == q else 1.0
+                for pos in postings[word]:
+                    if hit.get(pos, 0.0) < w:
+                        hit[pos] = w
+            if candidates is None:
+                candidates = set(hit)
+            else:
+                candidates &= hit.keys()
+            if not candidates:
+                break
+            for pos in candidates:
+                tok_scores[pos] = tok_scores.get(pos, 0.0) + hit[pos]
+        for pos in candidates or ():
+            # الأسماء الأقصر (أقرب للبحث) الأول لو نفس الـ score
+            s = tok_scores[pos] - len(index["names"][pos]) / 1000.0
+            scores[pos] = max(scores.get(pos, 0.0), s)
+
+    top = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])
+    return [(index["ids"][pos], round(score, 3)) for pos, score in top]
+
+
+def fuzzy_search_patients(index, query, limit=10, min_score=0.35, max_candidates=500):
+    """
+    بحث تقريبي (أخطاء إملائية / عربي↔إنجليزي): Dice على الـ trigrams
+    (الاسم نفسه أو هيكل الحروف الساكنة – الأعلى).
+    list من (Patient_ID, score) – score من 0 لـ 1.
+    المرشحين بيتجمعوا من الـ trigrams النادرة الأول، وبعدين Dice كامل للمرشحين بس.
+    """
+    norm = normalize_name(query)
+    skel = name_skeleton(norm)
+    q_grams = _name_grams(norm, skel)
+    n_patients = len(index["ids"])
+    if not q_grams or not n_patients:
+        return []
+
+    postings = index["grams"]
+    present = sorted((g for g in q_grams if g in postings), key=lambda g: len(postings[g]))
+    # trigram موجود في أكتر من 10% من المرضى مش بيفرّق – يتحسب في الـ Dice بس
+    cap = max(1000, n_patients // 10)
+    rare = [g for g in present if len(postings[g]) <= cap] or present
+
+    overlap = Counter()
+    for g in rare:
+        overlap.update(postings[g])
+    candidates = [pos for pos, _ in overlap.most_common(max_candidates)]
+
+    scored = []
+    for pos in candidates:
+        score = _name_score(norm, skel, index["names"][pos], index["skeletons"][pos])
+        if score >= min_score:
+            scored.append((pos, score))
+    top = heapq.nlargest(limit, scored, key=lambda kv: kv[1])
+    return [(index["ids"][pos], round(score, 3)) for pos, score in top]
+
+
+def possible_duplicates(index, name, phone=None, dob=None, parent_name=None, min_score=0.75, limit=5):
+    """
+    مرضى ممكن يكونوا نفس الشخص (قبل إضافة مريض جديد):
+    - نفس رقم الهاتف بالظبط، أو
+    - اسم قريب (نفسه أو هيكله) + تأكيد من نفس تاريخ الميلاد أو اسم ولي أمر قريب.
+    الاسم لوحده مش كفاية: الهيكل بيجمع أسماء مختلفة (حسن/حسين، سارة/إسراء).
+    """
+    hits = {}
+    if name:
+        dob_key = _dob_key(dob)
+        q_parent = normalize_name(parent_name) if isinstance(parent_name, str) else ""
+        q_parent_skel = name_skeleton(q_parent)
+        for pid, score in fuzzy_search_patients(index, name, limit=max(limit, 20), min_score=min_score):
+            pos = index["pos_of"][pid]
+            same_dob = bool(dob_key) and index["dobs"][pos] == dob_key
+            parent = index["parents"][pos]
+            same_parent = bool(q_parent and parent) and _name_score(
+                q_parent, q_parent_skel, parent, name_skeleton(parent)
+            ) >= min_score
+            if same_dob or same_parent:
+                hits[pid] = score
+    key = _phone_key(phone)
+    if len(key) >= 7:
+        phones = index["phones"]
+        i = bisect_left(phones, (key,))
+        while i < len(phones) and phones[i][0] == key:
+            hits[index["ids"][phones[i][1]]] = 1.0
+            i += 1
+    return sorted(hits.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+
+
+def recent_patient_ids(index, limit=20):
+    """آخر المرضى المضافين (الأحدث الأول)."""
+    return index["ids"][-limit:][::-1] if limit else []
+
+
+def patient_label(index, patient_id) -> str:
+    pos = index["pos_of"].get(patient_id)
+    name = index["labels"][pos] if pos is not None else ""
+    return f"{patient_id} - {name}".strip(" -")
+
+
+def take_patients(patients, hits):
+    """صفوف المرضى بنفس ترتيب نتيجة البحث + عمود Score."""
+    if not hits:
+        return patients.iloc[0:0]
+    order = pd.DataFrame(hits, columns=["Patient_ID", "Score"])
+    ids = pd.to_numeric(patients["Patient_ID"], errors="coerce")
+    sub = patients[ids.isin(order["Patient_ID"])].copy()
+    sub["Patient_ID"] = pd.to_numeric(sub["Patient_ID"], errors="coerce").astype("Int64")
+    order["Patient_ID"] = order["Patient_ID"].astype("Int64")
+    return order.merge(sub.drop_duplicates("Patient_ID"), on="Patient_ID", how="inner")
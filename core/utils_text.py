@@ -0,0 +1,128 @@
+# core/utils_text.py
+# أدوات تطبيع النصوص + trigrams (تستخدم في أسماء الأدوية والبحث عن المرضى)
+
+import re
+
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+_SPACES_RE = re.compile(r"\s+")
+_NON_DIGITS_RE = re.compile(r"\D+")
+
+# تشكيل + tatweel (بيتشالوا) وتوحيد أشكال الحروف اللي بتتكتب بأكتر من طريقة
+_AR_DIACRITICS_RE = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u0640]")
+_AR_CHAR_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+    "ؤ": "و",
+    "ئ": "ي",
+    # أرقام عربية/فارسية → 0-9
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+})
+
+
+# =========================================================
+# تطبيع بسيط: lower + إزالة الرموز + مسافة واحدة
+# =========================================================
+def normalize_basic(text) -> str:
+    if text is None:
+        return ""
+    s = str(text).lower()
+    s = _PUNCT_RE.sub(" ", s)
+    return _SPACES_RE.sub(" ", s).strip()
+
+
+def normalize_name(text) -> str:
+    """
+    تطبيع أسماء (عربي/إنجليزي): يشيل التشكيل والـ tatweel ويوحّد
+    أ/إ/آ → ا، ة → ه، ى → ي، وبعدين normalize_basic.
+    """
+    if text is None:
+        return ""
+    s = _AR_DIACRITICS_RE.sub("", str(text)).translate(_AR_CHAR_MAP)
+    return normalize_basic(s)
+
+
+# هيكل الحروف الساكنة: بيقرّب بين كتابة الاسم بالعربي وبالإنجليزي
+# (محمد / Mohamed → "mhmd") – الحروف المتحركة والحروف اللي صوتها متقارب بتتوحد
+_SKELETON_DIGRAPHS = (("sh", "s"), ("kh", "k"), ("gh", "g"), ("th", "t"), ("dh", "z"), ("ph", "f"))
+_SKELETON_MAP = str.maketrans({
+    "ب": "b", "ت": "t", "ث": "t", "ج": "g", "ح": "h", "خ": "k", "د": "d", "ذ": "z",
+    "ر": "r", "ز": "z", "س": "s", "ش": "s", "ص": "s", "ض": "d", "ط": "t", "ظ": "z",
+    "غ": "g", "ف": "f", "ق": "k", "ك": "k", "ل": "l", "م": "m", "ن": "n", "ه": "h",
+    "ا": None, "و": None, "ي": None, "ع": None, "ء": None,
+    "a": None, "e": None, "i": None, "o": None, "u": None, "y": None, "w": None,
+    "j": "g", "q": "k", "c": "k", "v": "f", "p": "b", "x": "k",
+})
+
+
+def name_skeleton(norm: str) -> str:
+    """norm لازم يكون من normalize_name."""
+    out = []
+    for tok in norm.split():
+        for a, b in _SKELETON_DIGRAPHS:
+            tok = tok.replace(a, b)
+        tok = tok.translate(_SKELETON_MAP)
+        # حروف مكررة ورا بعض = حرف واحد، والـ h في آخر الكلمة (ة/ه/ah) بتتشال
+        tok = "".join(ch for i, ch in enumerate(tok) if i == 0 or ch != tok[i - 1])
+        tok = tok[:-1] if len(tok) > 1 and tok.endswith("h") else tok
+        if tok:
+            out.append(tok)
+    return " ".join(out)
+
+
+def digits_only(text) -> str:
+    if text is None:
+        return ""
+    return _NON_DIGITS_RE.sub("", str(text).translate(_AR_CHAR_MAP))
+
+
+def digits_only_series(series):
+    """digits_only على عمود pandas كامل مرة واحدة (NaN / None → "")."""
+    digits = series.astype(str).str.translate(_AR_CHAR_MAP).str.replace(_NON_DIGITS_RE, "", regex=True)
+    return digits.fillna("")
+
+
+# =========================================================
+# Trigrams + Dice similarity
+# =========================================================
+def trigrams(text: str) -> set:
+    """
+    character trigrams لنص متطبّع (مع padding بمسافات على الأطراف).
+    """
+    if not text:
+        return set()
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def dice_similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return 2.0 * len(a & b) / (len(a) + len(b))
+
+
+# =========================================================
+# Edit distance (Levenshtein) – للأخطاء الإملائية الصغيرة
+# =========================================================
+def edit_distance(a: str, b: str, max_dist: int = None) -> int:
+    """
+    عدد التعديلات (إضافة/حذف/استبدال حرف) من a لـ b.
+    لو max_dist متحدد ووصلنا لأكتر منه بنوقف ونرجّع max_dist + 1.
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_dist is not None and len(a) - len(b) > max_dist:
+        return max_dist + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if max_dist is not None and min(cur) > max_dist:
+            return max_dist + 1
+        prev = cur
+    return prev[-1]
@@ -0,0 +1,200 @@
+# core/utils_trends.py
+# مكعب زمني (Time-series cube) للزيارات والتشخيصات والأدوية والنتائج
+
+from collections import Counter, deque
+
+import pandas as pd
+
+
+VISIT_KEYS = ["day", "Diagnosis", "Outcome_Class"]
+LINE_KEYS = ["day", "Diagnosis", "Drug_Name", "Outcome_Class"]
+
+PERIOD_FREQS = {"D": "D", "W": "W-SAT", "M": "M"}
+
+
+def _cube_base(rows):
+    cols = ["Visit_ID", "Visit_Date", "Diagnosis", "Drug_Name", "Outcome_Class"]
+    df = rows.reindex(columns=cols)
+    df = df.assign(day=pd.to_datetime(df["Visit_Date"], errors="coerce").dt.normalize())
+    df = df.dropna(subset=["day"])
+    return df.fillna({"Diagnosis": "Unknown", "Drug_Name": "Unknown", "Outcome_Class": "Unknown"})
+
+
+def _count_into(counter, df, keys):
+    if df.empty:
+        return counter
+    sizes = df.groupby(keys).size()
+    for key, n in zip(sizes.index, sizes.to_numpy()):
+        counter[key] += int(n)
+    return counter
+
+
+# =========================================================
+# بناء + تحديث المكعب
+# =========================================================
+def build_trend_cube(data_merged):
+    """
+    يرجّع {"visits": Counter, "lines": Counter}:
+    - visits: (day, Diagnosis, Outcome_Class) → عدد الزيارات
+    - lines:  (day, Diagnosis, Drug_Name, Outcome_Class) → عدد سطور الأدوية
+    """
+    return update_trend_cube({"visits": Counter(), "lines": Counter()}, data_merged)
+
+
+def update_trend_cube(cube, new_rows):
+    """بيضيف السطور الجديدة بس (O(السطور المضافة))."""
+    if new_rows is None or new_rows.empty:
+        return cube
+    df = _cube_base(new_rows)
+    visits = df.drop_duplicates("Visit_ID") if df["Visit_ID"].notna().any() else df
+    _count_into(cube["visits"], visits, VISIT_KEYS)
+    _count_into(cube["lines"], df[df["Drug_Name"] != "Unknown"], LINE_KEYS)
+    return cube
+
+
+# =========================================================
+# قراءة المكعب (بدون أي scan على الداتا الخام)
+# =========================================================
+def cube_frame(cube, metric="visits", freq="D", by="Diagnosis"):
+    """
+    DataFrame (period, <by>, count) من المكعب بعد التجميع على الفترة المطلوبة.
+    metric: "visits" أو "lines" – التجميع بالدواء متاح في lines بس.
+    """
+    counter = cube["lines"] if (metric == "lines" or by == "Drug_Name") else cube["visits"]
+    keys = LINE_KEYS if counter is cube["lines"] else VISIT_KEYS
+    if not counter:
+        return pd.DataFrame(columns=["period", by, "count"])
+
+    df = pd.DataFrame(list(counter.keys()), columns=keys)
+    df["count"] = list(counter.values())
+    df["period"] = df["day"].dt.to_period(PERIOD_FREQS.get(freq, "D")).dt.start_time
+    return (
+        df.groupby(["period", by], as_index=False)["count"]
+        .sum()
+        .sort_values(["period", "count"], ascending=[True, False])
+    )
+
+
+# =========================================================
+# كاشف الزيادة المفاجئة لكل تشخيص (Streaming EWMA)
+# =========================================================
+# لكل تشخيص: عدد اليوم الحالي + آخر (window − 1) يوم + EWMA لمجموع النافذة
+# (mean/var). كل زيارة جديدة O(1)؛ الأيام الفاضلة بتتقفل بعدد محدود من الخطوات.
+def _new_state(day, window):
+    return {
+        "last_day": day,
+        "today": 0,
+        "recent": deque([0] * (window - 1), maxlen=window - 1),
+        "mean": 0.0,
+        "var": 0.0,
+        "n_days": 0,
+    }
+
+
+def _close_day(state, alpha):
+    # baseline = كل النوافذ اللي فاتت (النافذة الحالية مش داخلة فيه)
+    x = sum(state["recent"]) + state["today"]
+    if state["n_days"] == 0:
+        state["mean"] = float(x)
+    else:
+        diff = x - state["mean"]
+        incr = alpha * diff
+        state["mean"] += incr
+        state["var"] = (1 - alpha) * (state["var"] + diff * incr)
+    state["n_days"] += 1
+    state["recent"].append(state["today"])
+    state["today"] = 0
+
+
+def outbreak_add_visit(detector, diagnosis, visit_date):
+    """تحديث الكاشف بزيارة واحدة – O(1) (مستهلك)."""
+    day = pd.to_datetime(visit_date, errors="coerce")
+    if pd.isna(day) or not isinstance(diagnosis, str) or not diagnosis.strip():
+        return detector
+    day = day.normalize()
+    window = detector["window"]
+    state = detector["states"].get(diagnosis)
+    if state is None:
+        state = detector["states"][diagnosis] = _new_state(day, window)
+
+    gap = (day - state["last_day"]).days
+    if gap == 0:
+        state["today"] += 1
+    elif gap > 0:
+        # بعد عدد كافي من الأيام الفاضلة الـ EWMA بيقرب من الصفر – مفيش داعي نكمل
+        for _ in range(min(gap, detector["max_catchup"])):
+            _close_day(state, detector["alpha"])
+        state["last_day"] = day
+        state["today"] = 1
+    elif -gap < window:
+        # زيارة بتاريخ قديم لسه جوه النافذة
+        state["recent"][gap] += 1
+    return detector
+
+
+def build_outbreak_detector(visits, window=7, alpha=0.1, z=3.0, min_cases=3, warmup_days=28):
+    """
+    يبني الكاشف بالمرور على الزيارات مرة واحدة بترتيب التاريخ.
+    """
+    detector = {
+        "window": int(window),
+        "alpha": float(alpha),
+        "z": float(z),
+        "min_cases": int(min_cases),
+        "warmup_days": int(warmup_days),
+        "max_catchup": max(int(window), int(5 / alpha)),
+        "states": {},
+    }
+    if visits is None or visits.empty:
+        return detector
+    v = visits.reindex(columns=["Visit_ID", "Diagnosis", "Visit_Date"]).dropna(subset=["Visit_Date"])
+    if v["Visit_ID"].notna().any():
+        v = v.drop_duplicates("Visit_ID")
+    v = v.sort_values("Visit_Date", kind="mergesort")
+    for diag, day in zip(v["Diagnosis"], v["Visit_Date"]):
+        outbreak_add_visit(detector, diag, day)
+    return detector
+
+
+def _window_sum(state, as_of, window):
+    lag = (as_of - state["last_day"]).days
+    if lag <= 0:
+        return sum(state["recent"]) + state["today"]
+    if lag >= window:
+        return 0
+    # الأيام اللي لسه جوه النافذة لحد as_of
+    recent = list(state["recent"]) + [state["today"]]
+    return sum(recent[lag:])
+
+
+def outbreak_alerts(detector, as_of=None):
+    """
+    التشخيصات اللي مجموع النافذة الحالية فيها أعلى من baseline + z·std.
+    as_of الافتراضي = آخر يوم فيه زيارات في الداتا.
+    """
+    cols = ["Diagnosis", "window_cases", "baseline", "threshold", "z_score"]
+    states = detector["states"]
+    if not states:
+        return pd.DataFrame(columns=cols)
+    if as_of is None:
+        as_of = max(s["last_day"] for s in states.values())
+    else:
+        as_of = pd.to_datetime(as_of).normalize()
+
+    rows = []
+    for diag, s in states.items():
+        if s["n_days"] < detector["warmup_days"]:
+            continue
+        current = _window_sum(s, as_of, detector["window"])
+        std = s["var"] ** 0.5
+        threshold = s["mean"] + detector["z"] * max(std, 1.0)
+        if current >= detector["min_cases"] and current > threshold:
+            rows.append({
+                "Diagnosis": diag,
+                "window_cases": int(current),
+                "baseline": round(s["mean"], 2),
+                "threshold": round(threshold, 2),
+                "z_score": round((current - s["mean"]) / max(std, 1.0), 2),
+            })
+    out = pd.DataFrame(rows, columns=cols)
+    return out.sort_values("z_score", ascending=False).reset_index(drop=True)